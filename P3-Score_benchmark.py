@@ -0,0 +1,311 @@
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+
+# Amino acids and the atoms written for every residue of a synthetic protein
+residue_list = [["ALA", ["N", "CA", "C", "O", "CB"]], ["VAL", ["N", "CA", "C", "O", "CB", "CG1", "CG2"]],
+                ["SER", ["N", "CA", "C", "O", "CB", "OG"]], ["LYS", ["N", "CA", "C", "O", "CB", "CG", "CD", "CE", "NZ"]],
+                ["ASP", ["N", "CA", "C", "O", "CB", "CG", "OD1", "OD2"]], ["GLY", ["N", "CA", "C", "O"]],
+                ["PHE", ["N", "CA", "C", "O", "CB", "CG", "CD1", "CD2", "CE1", "CE2", "CZ"]],
+                ["HIS", ["N", "CA", "C", "O", "CB", "CG", "ND1", "CD2", "CE1", "NE2"]]]
+
+# Atom types of a synthetic ligand and how often they are drawn
+ligand_type_list = ["C.3"] * 6 + ["C.ar"] * 6 + ["C.2"] * 2 + ["N.3", "N.ar", "N.am", "O.3", "O.2", "S.3", "Cl", "F"] + \
+                   ["H"] * 4
+
+# Program that stands in for xscore, writing one "Total" line of stable values for every ligand
+fake_xscore = '''#!{python}
+import random
+import sys
+import zlib
+
+block_list = open(sys.argv[-1]).read().split("@<TRIPOS>MOLECULE\\n")[1:]
+with open("xscore.log", "w") as fo:
+    fo.write("X-Score log written by P3-Score_benchmark.py\\n\\n")
+    for block in block_list:
+        rnd = random.Random(zlib.crc32(block.encode()))
+        fo.write("Total  %.2f  %.2f  0.00  %.2f  %.2f  %.2f  %.2f\\n\\n" % tuple(rnd.uniform(0.1, 5) for _ in range(6)))
+'''
+
+
+def load_predict():
+    """
+    Load P3-Score_predict.py next to this file as a module
+    :return: module of P3-Score_predict.py
+    """
+    file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "P3-Score_predict.py")
+    spec = importlib.util.spec_from_file_location("p3score_predict", file_name)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["p3score_predict"] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def write_protein(file_name, atom_num, seed=0):
+    """
+    Write a synthetic protein file, residues are spread at random over a cube of protein density
+    :param file_name: The name of the protein file
+    :param atom_num: Number of atoms, the last residue may be cut short
+    :param seed: Seed of the random numbers
+    :return: Length of the edge of the cube
+    """
+    rnd = random.Random(seed)
+    side = (atom_num / 0.05) ** (1 / 3)
+    count, res_num = 0, 0
+    with open(f"{file_name}", 'w') as fo:
+        while count < atom_num:
+            res_name, atom_list = residue_list[res_num % len(residue_list)]
+            res_num += 1
+            x, y, z = rnd.uniform(0, side), rnd.uniform(0, side), rnd.uniform(0, side)
+            for atom_name in atom_list[:atom_num - count]:
+                count += 1
+                x, y, z = x + rnd.uniform(-1.5, 1.5), y + rnd.uniform(-1.5, 1.5), z + rnd.uniform(-1.5, 1.5)
+                fo.write("ATOM  %5d %-4s %3s A%4d    %8.3f%8.3f%8.3f  1.00  0.00           %s\n" % (
+                    count % 100000, " " + atom_name, res_name, res_num % 10000, x, y, z, atom_name[0]))
+        fo.write("END\n")
+
+    return side
+
+
+def write_library(file_name, ligand_num, atom_num, center, seed=0):
+    """
+    Write a synthetic ligand file of poses, every ligand is a random walk of bonded atoms with a few rings closed
+    :param file_name: The name of the ligand file
+    :param ligand_num: Number of ligands
+    :param atom_num: Number of atoms of every ligand, 4 at least
+    :param center: 3D coordinates the poses start from
+    :param seed: Seed of the random numbers
+    """
+    rnd = random.Random(seed)
+    atom_num = max(4, int(atom_num))
+    with open(f"{file_name}", 'w') as fo:
+        for m in range(ligand_num):
+            x, y, z = [i + rnd.uniform(-2, 2) for i in center]
+            atom_list, bond_list = [], []
+            for a in range(atom_num):
+                x, y, z = x + rnd.uniform(-1, 1), y + rnd.uniform(-1, 1), z + rnd.uniform(-1, 1)
+                atom_list.append((x, y, z, rnd.choice(ligand_type_list)))
+                if a > 0:
+                    bond_list.append((a, a + 1, "ar" if atom_list[-1][3] == "C.ar" else "1"))
+            for a in range(5, atom_num, 6):
+                bond_list.append((a - 4, a + 1, "1"))
+
+            fo.write(f"@<TRIPOS>MOLECULE\nbench{m}\n {atom_num} {len(bond_list)} 0 0 0\nSMALL\nUSER_CHARGES\n\n")
+            fo.write("@<TRIPOS>ATOM\n")
+            for a, (x, y, z, kind) in enumerate(atom_list):
+                fo.write("%7d %-8s %9.4f %9.4f %9.4f %-7s %4d %-8s %9.4f\n" % (
+                    a + 1, kind.split(".")[0] + str(a + 1), x, y, z, kind, 1, "LIG", 0.0))
+            fo.write("@<TRIPOS>BOND\n")
+            for b, (a1, a2, kind) in enumerate(bond_list):
+                fo.write("%6d %5d %5d %s\n" % (b + 1, a1, a2, kind))
+
+
+def write_fake_xscore(path):
+    """
+    Write the program that stands in for xscore
+    :param path: Directory of the program, to be put in front of PATH
+    :return: The name of the program file
+    """
+    file_name = os.path.join(path, "xscore")
+    with open(file_name, 'w') as fo:
+        fo.write(fake_xscore.format(python=sys.executable))
+    os.chmod(file_name, 0o755)
+
+    return file_name
+
+
+def time_stage(function, repeat):
+    """
+    Time a stage several times
+    :param function: Function of the stage without arguments
+    :param repeat: Number of runs
+    :return: Dictionary of the median, best and every time in seconds
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    return {"median": round(statistics.median(seconds), 6), "best": round(min(seconds), 6),
+            "runs": [round(i, 6) for i in seconds]}
+
+
+def read_ligand_loop(predict, file_name):
+    """
+    Read a ligand file with the line by line reader
+    :param predict: module of P3-Score_predict.py
+    :param file_name: The name of the ligand file
+    :return: List of the records of every ligand
+    """
+    with open(f"{file_name}", 'r') as fi:
+        return list(predict.Get_info_tools.parse_ligand_loop(fi))
+
+
+def run_serial(predict, ligand_file, protein_file, ac):
+    """
+    Score a ligand file with the stages in turn instead of at the same time
+    :param predict: module of P3-Score_predict.py
+    :param ligand_file: The name of the ligand file
+    :param protein_file: The name of the protein file
+    :param ac: Accuracy of volume calculation
+    :return: List of the result of every ligand
+    """
+    depth = predict.Get_info_tools.pipeline_depth
+    predict.Get_info_tools.pipeline_depth = 0
+    try:
+        return list(predict.Stream_tools(ligand_file, protein_file, ac).get_result())
+    finally:
+        predict.Get_info_tools.pipeline_depth = depth
+
+
+def run_case(predict, path, protein_atoms, ligand_atoms, poses, ac, repeat, seed):
+    """
+    Time every stage of one case of synthetic inputs
+    :param predict: module of P3-Score_predict.py
+    :param path: Directory of the input files
+    :param protein_atoms: Number of protein atoms
+    :param ligand_atoms: Number of atoms of every ligand
+    :param poses: Number of ligands
+    :param ac: Accuracy of volume calculation
+    :param repeat: Number of runs of every stage
+    :param seed: Seed of the random numbers
+    :return: Dictionary of the case and the times of its stages
+    """
+    protein_file = os.path.join(path, f"protein_{protein_atoms}_{seed}.pdb")
+    ligand_file = os.path.join(path, f"ligand_{ligand_atoms}_{poses}_{seed}.mol2")
+    if not os.path.exists(protein_file):
+        write_protein(protein_file, protein_atoms, seed)
+    side = (protein_atoms / 0.05) ** (1 / 3)
+    if not os.path.exists(ligand_file):
+        write_library(ligand_file, poses, ligand_atoms, [side / 2] * 3, seed)
+
+    tool = predict.Stream_tools(None, protein_file, ac)
+    record_list = list(tool.read_ligand(ligand_file))
+    ligand_list = [i[3] for i in record_list]
+    center_list = [tool.get_volume_center(i)[1] for i in ligand_list]
+    feature_list = [i[:14] for i in tool.get_batch_feature(record_list)]
+
+    stage = {
+        "parse_protein": lambda: predict.Protein_atoms.read_pdb(protein_file),
+        "parse_protein_loop": lambda: predict.Protein_atoms.read_pdb_loop(protein_file),
+        "index_protein": lambda: predict.Protein_index(tool.protein_info),
+        "read_ligand": lambda: list(tool.read_ligand(ligand_file)),
+        "read_ligand_loop": lambda: read_ligand_loop(predict, ligand_file),
+        "get_volume": lambda: [tool.get_volume_center(i) for i in ligand_list],
+        "get_polar": lambda: [tool.get_polar(i) for i in ligand_list],
+        "get_ami": lambda: [tool.get_ami(i, c) for i, c in zip(ligand_list, center_list)],
+        "xscore": lambda: tool.score_molecule(os.path.abspath(protein_file), [i[4] for i in record_list], 1),
+        "get_predict": lambda: predict.calc.get_predict_batch(feature_list),
+        "end_to_end": lambda: list(predict.Stream_tools(ligand_file, protein_file, ac).get_result()),
+        "end_to_end_serial": lambda: run_serial(predict, ligand_file, protein_file, ac),
+    }
+    result = {name: time_stage(function, repeat) for name, function in stage.items()}
+    for v in result.values():
+        v["per_ligand"] = round(v["median"] / max(1, poses), 9)
+
+    # The parsers also report their throughput over the size of the file
+    for name, file_name in [("parse_protein", protein_file), ("read_ligand", ligand_file)]:
+        for stage_name in [name, f"{name}_loop"]:
+            median = result[stage_name]["median"]
+            result[stage_name]["mb_per_s"] = round(os.path.getsize(file_name) / 1e6 / median, 3) if median > 0 else None
+
+    return {"protein_atoms": protein_atoms, "ligand_atoms": ligand_atoms, "poses": poses, "ac": ac, "seed": seed,
+            "stages": result}
+
+
+def get_commit():
+    """
+    Find the git commit of this file
+    :return: hash of the commit, None outside of git
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """
+    Print the ratio of the median times of every stage between two results
+    :param old: result of the earlier run
+    :param new: result of the later run
+    """
+
+    # The stage column is as wide as the longest stage name
+    width = max([len("stage")] + [len(k) for case in new["cases"] for k in case["stages"]]) + 2
+    row = "{:<34}{:<%d}{:<12}{:<12}{:<8}" % width
+    print(row.format("case", "stage", "old", "new", "ratio"))
+    old_case = {(i["protein_atoms"], i["ligand_atoms"], i["poses"], i["ac"], i["seed"]): i for i in old["cases"]}
+    for case in new["cases"]:
+        key = (case["protein_atoms"], case["ligand_atoms"], case["poses"], case["ac"], case["seed"])
+        if key not in old_case:
+            continue
+        for name, v in case["stages"].items():
+            if name not in old_case[key]["stages"]:
+                continue
+            before = old_case[key]["stages"][name]["median"]
+            print(row.format(
+                "p%d l%d n%d ac%s" % key[:4], name, before, v["median"],
+                round(v["median"] / before, 3) if before > 0 else "-"))
+
+
+@click.command()
+@click.option('--protein_atoms', multiple=True, type=int, help="atoms of a synthetic protein, can be repeated")
+@click.option('--ligand_atoms', multiple=True, type=int, help="atoms of a synthetic ligand, can be repeated")
+@click.option('--poses', multiple=True, type=int, help="ligands of a synthetic library, can be repeated")
+@click.option('--ac', multiple=True, type=float, help="accuracy of volume calculation, can be repeated")
+@click.option('--repeat', nargs=1, default=3, type=int, help="runs of every stage")
+@click.option('--seed', nargs=1, default=0, type=int, help="seed of the synthetic inputs")
+@click.option('--output', nargs=1, default="benchmark.json", help="JSON file of the results")
+@click.option('--compare', 'compare_file', nargs=1, default=None, help="JSON file of an earlier run to compare with")
+@click.option('--keep', nargs=1, default=None, help="directory to keep the synthetic inputs in")
+def benchmark(protein_atoms, ligand_atoms, poses, ac, repeat, seed, output, compare_file, keep):
+    """
+    Time every stage of P3-Score on synthetic inputs, offline with a stand-in for xscore
+    """
+    protein_atoms = protein_atoms or (2000, 20000)
+    ligand_atoms = ligand_atoms or (20, 60)
+    poses = poses or (50,)
+    ac = ac or (2.0, 3.0)
+    predict = load_predict()
+    result = {"commit": get_commit(), "python": platform.python_version(), "numpy": np.__version__,
+              "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "cases": []}
+
+    # Inputs and the stand-in for xscore live in a temporary directory unless they are kept
+    with tempfile.TemporaryDirectory(prefix="p3score_bench_") as temp_path:
+        path = keep or temp_path
+        os.makedirs(path, exist_ok=True)
+        write_fake_xscore(temp_path)
+        os.environ["PATH"] = temp_path + os.pathsep + os.environ["PATH"]
+        for p in protein_atoms:
+            for la in ligand_atoms:
+                for n in poses:
+                    for a in ac:
+                        case = run_case(predict, path, p, la, n, a, repeat, seed)
+                        result["cases"].append(case)
+                        print("p%-8d l%-5d n%-6d ac%-5s %s" % (p, la, n, a, "  ".join(
+                            f"{k} {v['median']:.4f}" for k, v in case["stages"].items())))
+
+    with open(f"{output}", 'w') as fo:
+        json.dump(result, fo, indent=1)
+    print(f"The results in the file of '{output}'")
+    if compare_file is not None:
+        with open(f"{compare_file}", 'r') as fi:
+            compare(json.load(fi), result)
+
+
+if __name__ == '__main__':
+    benchmark()
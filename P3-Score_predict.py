@@ -6,9 +6,570 @@ usage: python3 P3-score.py --p protein_file --l ligand_file (--ac float(from 2 t
 author: Li Chuang
 date: 2022-3-25
 """
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain, islice, repeat, zip_longest
 from math import sqrt
+import hashlib
+import heapq
+import atexit
+import bz2
+import copy
+import gzip
+import json
+import lzma
+import mmap
+import multiprocessing
 import os
+import queue
+import re
+import shutil
+import socketserver
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
 import click
+import numpy as np
+
+
+class Protein_atoms(object):
+    """
+    Protein atoms kept in typed arrays, names are stored as codes into lists of the distinct names
+    """
+
+    def __init__(self, coord, atom_code, res_name_code, res_id_code, atom_names, res_names, res_ids):
+        """
+        initialization
+        :param coord: N x 3 array of 3D coordinates
+        :param atom_code: Array of codes of the element types
+        :param res_name_code: Array of codes of the amino acids belonging to
+        :param res_id_code: Array of codes of the numbers of amino acid
+        :param atom_names: List of the distinct element types
+        :param res_names: List of the distinct amino acids
+        :param res_ids: List of the distinct numbers of amino acid
+        """
+        self.coord = np.asarray(coord, dtype=np.float64).reshape(-1, 3)
+        self.atom_code = np.asarray(atom_code, dtype=np.int32)
+        self.res_name_code = np.asarray(res_name_code, dtype=np.int32)
+        self.res_id_code = np.asarray(res_id_code, dtype=np.int32)
+        self.atom_names = list(atom_names)
+        self.res_names = list(res_names)
+        self.res_ids = list(res_ids)
+
+    def __len__(self):
+        return len(self.coord)
+
+    def __getitem__(self, i):
+        # The same list of element type, amino acid, number of amino acid and 3D coordinates as the text reader
+        return [self.atom_names[self.atom_code[i]], self.res_names[self.res_name_code[i]],
+                self.res_ids[self.res_id_code[i]]] + self.coord[i].tolist()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @classmethod
+    def read(cls, file_name, cache=False):
+        """
+        Read the atoms of a protein file, through the binary sidecar file when asked for
+        :param file_name: The name of the protein file
+        :param cache: Keep the parsed atoms in a sidecar file next to the protein file and load them from it
+        :return: Protein_atoms
+        """
+        if not cache:
+            return cls.read_pdb(file_name)
+        sidecar = f"{file_name}.p3.npz"
+        state = os.stat(file_name)
+
+        # The sidecar is used when the modification time and size still match, or else when the content does
+        file_hash = None
+        if os.path.exists(sidecar):
+            try:
+                data = cls.load_sidecar(sidecar)
+                if int(data["mtime"]) != state.st_mtime_ns or int(data["size"]) != state.st_size:
+                    file_hash = Feature_cache.get_file_hash(file_name)
+                if file_hash is None or str(data["hash"]) == file_hash:
+                    return cls(data["coord"], data["atom_code"], data["res_name_code"], data["res_id_code"],
+                               data["atom_names"].tolist(), data["res_names"].tolist(), data["res_ids"].tolist())
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+                pass
+
+        atoms = cls.read_pdb(file_name)
+        try:
+            atoms.save(sidecar, file_hash or Feature_cache.get_file_hash(file_name), state)
+        except OSError as error:
+            print(f"The parsed protein can not be kept in {sidecar}: {error}")
+
+        return atoms
+
+    @classmethod
+    def read_pdb(cls, file_name):
+        """
+        Parse the ATOM and HETATM records of a protein file, plain or compressed, in blocks of whole lines
+        :param file_name: The name of the protein file
+        :return: Protein_atoms
+        """
+        coord, code_list, name_list = [], [[], [], []], [{}, {}, {}]
+        with open_binary(file_name) as fi:
+            rest = b""
+            while True:
+                data = fi.read(1 << 24)
+                block, rest = rest + data, b""
+
+                # A block ends with a whole line, the rest of the last line waits for the next block
+                if data != b"":
+                    cut = block.rfind(b"\n") + 1
+                    block, rest = block[:cut], block[cut:]
+                    if block == b"":
+                        continue
+                elif block == b"":
+                    break
+                part = cls.parse_pdb_block(block)
+                if part is None:
+                    part = cls.parse_pdb_text(block.decode())
+
+                # Read information includes: element type, amino acid belonging to, number of amino acid, 3D coordinates
+                coord.append(part[0])
+                for i in range(3):
+                    code_list[i].append(cls.get_code(part[1][i], name_list[i]))
+                if part[2] or data == b"":
+                    break
+            fi.close()
+        coord = np.concatenate(coord) if coord != [] else np.zeros((0, 3))
+        code_list = [np.concatenate(i) if i != [] else np.zeros(0, dtype=np.int32) for i in code_list]
+
+        return cls(coord, code_list[0], code_list[1], code_list[2], name_list[0], name_list[1], name_list[2])
+
+    @staticmethod
+    def parse_pdb_block(block):
+        """
+        Parse a block of records with NumPy, for well-formed files
+        :param block: bytes of whole lines
+        :return: N x 3 array of 3D coordinates, arrays of the element types, amino acids and numbers of amino acid as
+                 they are written, and whether an empty line ended the reading; None when the block is not well-formed
+        """
+        if not block.isascii() or b"\r" in block:
+            return None
+
+        # The reading stops at the first empty line, and a line starting with a blank moves its columns once stripped
+        block = b"\n" + block if block.endswith(b"\n") else b"\n" + block + b"\n"
+        empty = re.search(rb"\n[\t\x0b\x0c\x1c-\x1f ]*\n", block)
+        stop = empty is not None
+        if stop:
+            block = block[:empty.start() + 1]
+        if re.search(rb"\n[\t\x0b\x0c\x1c-\x1f ]", block):
+            return None
+
+        # Only the columns up to the coordinates are read, every record must reach them
+        atom_list = [k[:54] for k in re.findall(rb"\n((?:ATOM|HETATM)[^\n]*)", block)]
+        if atom_list != [] and min(map(len, atom_list)) < 54:
+            return None
+        row = np.frombuffer(b"".join(atom_list), dtype=np.uint8).reshape(-1, 54)
+
+        # Coordinates written as "%8.3f" are read digit by digit, the thousandths make them exact
+        field = row[:, 30:54].reshape(-1, 8)
+        digit = field - 48
+        is_digit, is_minus = digit <= 9, field == 45
+        is_sign = is_digit | is_minus
+        if not ((field[:, 4] == 46).all() and is_digit[:, 5:].all() and is_digit[:, 3].all() and
+                (is_sign | (field == 32))[:, :3].all() and not (is_sign[:, :3] & ~is_digit[:, 1:4]).any()):
+            return None
+        value = np.where(is_digit, digit, 0).astype(np.int64) @ np.array(
+            [1000000, 100000, 10000, 1000, 0, 100, 10, 1], dtype=np.int64) / 1000
+        value[is_minus.any(axis=1)] *= -1
+        field_list = [np.ascontiguousarray(row[:, a:b]).view(f"S{b - a}")[:, 0] for a, b in [(12, 16), (16, 20),
+                                                                                            (22, 27)]]
+
+        return value.reshape(-1, 3), field_list, stop
+
+    @classmethod
+    def parse_pdb_text(cls, text):
+        """
+        Parse a block of records line by line
+        :param text: text of whole lines
+        :return: N x 3 array of 3D coordinates, lists of the element types, amino acids and numbers of amino acid, and
+                 whether an empty line ended the reading
+        """
+        content_list = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        if content_list[-1] == "":
+            content_list.pop()
+        content_list = [k.strip() for k in content_list]
+
+        # The reading stops at the first empty line like the line by line reader
+        end = content_list.index("") if "" in content_list else len(content_list)
+        atom_list = [k for k in content_list[:end] if k[0:4] == "ATOM" or k[0:6] == "HETATM"]
+        field_list = [[k[12:16].strip() for k in atom_list], [k[16:20].strip() for k in atom_list],
+                      [k[22:27].strip() for k in atom_list]]
+        coord = np.array([[float(k[30:38].strip()), float(k[38:46].strip()), float(k[46:54].strip())]
+                          for k in atom_list], dtype=np.float64).reshape(-1, 3)
+
+        return coord, field_list, end < len(content_list)
+
+    @staticmethod
+    def get_code(value, name_dict):
+        """
+        Turn names into codes in the order they first appear
+        :param value: list of names, or array of names as they are written
+        :param name_dict: dictionary from every name to its code, new names are added
+        :return: Array of codes
+        """
+        if isinstance(value, list):
+            return np.array([name_dict.setdefault(k, len(name_dict)) for k in value], dtype=np.int32)
+        unique, first, inverse = np.unique(value, return_index=True, return_inverse=True)
+        code = np.zeros(len(unique), dtype=np.int32)
+        for i in np.argsort(first, kind="stable"):
+            code[i] = name_dict.setdefault(unique[i].decode().strip(), len(name_dict))
+
+        return code[inverse.reshape(-1)]
+
+    @classmethod
+    def read_pdb_loop(cls, file_name):
+        """
+        Parse the ATOM and HETATM records of a protein file line by line, kept as the reference for read_pdb
+        :param file_name: The name of the protein file
+        :return: Protein_atoms
+        """
+        coord, atom_code, res_name_code, res_id_code = [], [], [], []
+        atom_names, res_names, res_ids = {}, {}, {}
+        with open(f"{file_name}", 'r') as fi:
+            while True:
+                content = fi.readline().strip()
+                if content == "":
+                    break
+
+                # Read information includes: element type, amino acid belonging to, number of amino acid, 3D coordinates
+                if content[0:4] == "ATOM" or content[0:6] == "HETATM":
+                    atom_code.append(atom_names.setdefault(content[12:16].strip(), len(atom_names)))
+                    res_name_code.append(res_names.setdefault(content[16:20].strip(), len(res_names)))
+                    res_id_code.append(res_ids.setdefault(content[22:27].strip(), len(res_ids)))
+                    coord.append([float(content[30:38].strip()), float(content[38:46].strip()),
+                                  float(content[46:54].strip())])
+            fi.close()
+
+        return cls(coord, atom_code, res_name_code, res_id_code, atom_names, res_names, res_ids)
+
+    def with_coord(self, coord):
+        """
+        Give the same atoms at other coordinates, the names are shared
+        :param coord: N x 3 array of 3D coordinates
+        :return: Protein_atoms
+        """
+        return Protein_atoms(coord, self.atom_code, self.res_name_code, self.res_id_code, self.atom_names,
+                             self.res_names, self.res_ids)
+
+    @staticmethod
+    def split_model(file_name):
+        """
+        Cut a protein file at its ENDMDL records
+        :param file_name: The name of the protein file
+        :return: Generator of the text of every model, the whole file when it has no models
+        """
+        with open_binary(file_name) as fi:
+            rest, tail = b"", False
+            for data in iter(lambda: fi.read(1 << 24), b""):
+                part_list = (rest + data).split(b"\nENDMDL")
+                rest = part_list.pop()
+
+                # Every model but the first starts with the rest of the ENDMDL line before it
+                for i, part in enumerate(part_list):
+                    if i > 0 or tail:
+                        part = part[part.find(b"\n") + 1:]
+                    yield part + b"\n"
+                tail = tail or part_list != []
+            fi.close()
+        if tail:
+            rest = rest[rest.find(b"\n") + 1:] if b"\n" in rest else b""
+        if re.search(rb"(?:^|\n)(?:ATOM|HETATM)", rest):
+            yield rest
+
+    @classmethod
+    def read_frames(cls, block_list):
+        """
+        Parse the models of a trajectory, the names of the atoms are only parsed in the first one
+        :param block_list: Iterable of the text of every model
+        :return: Generator of the Protein_atoms of every model, which share the names of the first, and its text
+        """
+        first = None
+        for n, block in enumerate(block_list):
+            part = cls.parse_pdb_block(block)
+            if part is None:
+                part = cls.parse_pdb_text(block.decode())
+            if first is None:
+                name_list = [{}, {}, {}]
+                code_list = [cls.get_code(part[1][i], name_list[i]) for i in range(3)]
+                first = cls(part[0], code_list[0], code_list[1], code_list[2], name_list[0], name_list[1],
+                            name_list[2])
+                yield first, block
+            elif len(part[0]) != len(first):
+                raise RuntimeError(f"protein frame {n + 1} has {len(part[0])} atoms, the first frame has {len(first)}")
+            else:
+                yield first.with_coord(part[0]), block
+
+    @classmethod
+    def read_pocket(cls, file_name, low, high, pocket_name):
+        """
+        Parse the residues of a protein file that have an atom inside a box, and write them to a trimmed protein file
+        :param file_name: The name of the protein file
+        :param low: Lower corner of the box
+        :param high: Upper corner of the box
+        :param pocket_name: The name of the trimmed protein file
+        :return: Protein_atoms of the residues kept
+        """
+        coord, atom_code, res_name_code, res_id_code = [], [], [], []
+        atom_names, res_names, res_ids = {}, {}, {}
+        low, high = np.asarray(low, dtype=float), np.asarray(high, dtype=float)
+
+        def keep(residue):
+            # Whole residues are kept so that xscore still sees complete amino acids
+            if not any((low <= i[1]).all() and (i[1] <= high).all() for i in residue):
+                return
+            for content, xyz in residue:
+                fo.write(content + "\n")
+                atom_code.append(atom_names.setdefault(content[12:16].strip(), len(atom_names)))
+                res_name_code.append(res_names.setdefault(content[16:20].strip(), len(res_names)))
+                res_id_code.append(res_ids.setdefault(content[22:27].strip(), len(res_ids)))
+                coord.append(xyz)
+
+        with open_text(file_name) as fi, open(f"{pocket_name}", 'w') as fo:
+            residue, residue_key = [], None
+            while True:
+                content = fi.readline().strip()
+                if content == "":
+                    break
+
+                # The lines of one residue follow each other, so a residue is complete when the next one starts
+                if content[0:4] == "ATOM" or content[0:6] == "HETATM":
+                    if content[17:27] != residue_key:
+                        keep(residue)
+                        residue, residue_key = [], content[17:27]
+                    residue.append((content, [float(content[30:38].strip()), float(content[38:46].strip()),
+                                              float(content[46:54].strip())]))
+            keep(residue)
+            fo.write("END\n")
+            fi.close()
+
+        return cls(coord, atom_code, res_name_code, res_id_code, atom_names, res_names, res_ids)
+
+    def save(self, file_name, file_hash, state):
+        """
+        Write the atoms to a binary sidecar file, uncompressed so that load_sidecar can map the arrays
+        :param file_name: The name of the sidecar file
+        :param file_hash: hash of the protein file
+        :param state: os.stat of the protein file
+        """
+        temp_name = f"{file_name}.{os.getpid()}.tmp"
+        with open(temp_name, "wb") as fi:
+            np.savez(fi, coord=self.coord, atom_code=self.atom_code, res_name_code=self.res_name_code,
+                     res_id_code=self.res_id_code, atom_names=np.array(self.atom_names, dtype=str),
+                     res_names=np.array(self.res_names, dtype=str), res_ids=np.array(self.res_ids, dtype=str),
+                     hash=np.array(file_hash), mtime=np.array(state.st_mtime_ns), size=np.array(state.st_size))
+        os.replace(temp_name, file_name)
+
+    @staticmethod
+    def load_sidecar(file_name):
+        """
+        Map the arrays of an uncompressed sidecar file straight from the disk instead of reading them
+        :param file_name: The name of the sidecar file, as written by save
+        :return: Dictionary from the names to the arrays, read only
+        """
+        data = {}
+        with zipfile.ZipFile(file_name) as fz, open(f"{file_name}", 'rb') as fi:
+            for info in fz.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{info.filename} of {file_name} is compressed")
+
+                # The array starts after the local header of the member and the npy header
+                fi.seek(info.header_offset)
+                head = fi.read(30)
+                offset = info.header_offset + 30 + int.from_bytes(head[26:28], "little") + \
+                    int.from_bytes(head[28:30], "little")
+                fi.seek(offset)
+                version = np.lib.format.read_magic(fi)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fi)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fi)
+                name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+                if dtype.hasobject:
+                    raise ValueError(f"{info.filename} of {file_name} holds objects")
+
+                # Empty and single values are read, the rest is mapped
+                if shape == () or 0 in shape:
+                    data[name] = np.fromfile(fi, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+                else:
+                    data[name] = np.memmap(fi, dtype=dtype, mode="r", offset=fi.tell(), shape=shape,
+                                           order="F" if fortran_order else "C")
+
+        return data
+
+
+class Ligand_atoms(object):
+    """
+    Ligand atoms kept in typed arrays, atom types are stored as codes into a list of the distinct types
+    """
+
+    def __init__(self, coord, kind_code, kind_names):
+        """
+        initialization
+        :param coord: N x 3 array of 3D coordinates
+        :param kind_code: Array of codes of the atom types
+        :param kind_names: List of the distinct atom types
+        """
+        self.coord = np.asarray(coord, dtype=np.float64).reshape(-1, 3)
+        self.kind_code = np.asarray(kind_code, dtype=np.int32)
+        self.kind_names = list(kind_names)
+
+    def __len__(self):
+        return len(self.coord)
+
+    def __getitem__(self, i):
+        # The same list of 3D coordinates and atom type as the line reader
+        return self.coord[i].tolist() + [self.kind_names[self.kind_code[i]]]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @classmethod
+    def wrap(cls, ligand):
+        """
+        Take the ligand atoms as they are, or put a list of ligand molecule information into arrays
+        :param ligand: Ligand_atoms, or list of the 3D coordinates and atom type of every atom
+        :return: Ligand_atoms
+        """
+        if isinstance(ligand, cls):
+            return ligand
+        kind_dict = {}
+        kind_code = [kind_dict.setdefault(i[3], len(kind_dict)) for i in ligand]
+
+        return cls([i[0:3] for i in ligand], kind_code, kind_dict)
+
+    def get_kind(self):
+        """
+        Give the atom type of every atom
+        :return: List of atom types
+        """
+        return [self.kind_names[i] for i in self.kind_code.tolist()]
+
+    def get_value(self, table, default=0):
+        """
+        Look the atom types up in a dictionary once for every distinct type
+        :param table: Dictionary from the atom type to a number
+        :param default: number of the types that are not in the dictionary
+        :return: Array of the number of every atom
+        """
+        value = np.array([table.get(i, default) for i in self.kind_names] + [default], dtype=float)
+
+        return value[self.kind_code]
+
+
+class Protein_index(object):
+    """
+    Uniform cell grid over the protein atoms for fast radius queries
+    """
+
+    def __init__(self, protein_info, cell=6.0):
+        """
+        initialization
+        :param protein_info: Protein_atoms
+        :param cell: Edge length of a grid cell in angstroms
+        """
+        self.cell = float(cell)
+        self.coord = protein_info.coord
+        self.res_id = protein_info.res_id_code
+        self.res_name = protein_info.res_name_code
+        self.res_ids = protein_info.res_ids
+        self.res_names = protein_info.res_names
+        if len(self.coord) == 0:
+            self.origin = np.zeros(3)
+            self.shape = np.ones(3, dtype=int)
+            self.order = np.zeros(0, dtype=int)
+            self.start = self.end = np.zeros(1, dtype=int)
+            return
+
+        # Put every atom into a cell and sort the atoms by the number of their cell
+        self.origin = self.coord.min(axis=0)
+        cell_xyz = ((self.coord - self.origin) // self.cell).astype(int)
+        self.shape = cell_xyz.max(axis=0) + 1
+        cell_id = (cell_xyz[:, 0] * self.shape[1] + cell_xyz[:, 1]) * self.shape[2] + cell_xyz[:, 2]
+        self.order = np.argsort(cell_id, kind="stable")
+        sorted_id = cell_id[self.order]
+        all_id = np.arange(int(np.prod(self.shape)))
+        self.start = np.searchsorted(sorted_id, all_id, side="left")
+        self.end = np.searchsorted(sorted_id, all_id, side="right")
+
+    def query_box(self, low, high):
+        """
+        Find the atoms in the cells that overlap a box
+        :param low: Lower corner of the box
+        :param high: Upper corner of the box
+        :return: Ascending array of atom indices
+        """
+        low = np.maximum(((np.asarray(low) - self.origin) // self.cell).astype(int), 0)
+        high = np.minimum(((np.asarray(high) - self.origin) // self.cell).astype(int), self.shape - 1)
+        if (low > high).any():
+            return np.zeros(0, dtype=int)
+
+        # Cells along z are contiguous, so every (x, y) column of the box is one slice of the sorted atoms
+        parts = []
+        for ix in range(low[0], high[0] + 1):
+            for iy in range(low[1], high[1] + 1):
+                first = (ix * self.shape[1] + iy) * self.shape[2]
+                parts.append(self.order[self.start[first + low[2]]:self.end[first + high[2]]])
+
+        return np.sort(np.concatenate(parts))
+
+
+class Neighbor_list(object):
+    """
+    Verlet list of the protein atoms that can touch the ligand, kept over the frames of a trajectory and rebuilt only
+    when the atoms have moved further than the skin since it was built
+    """
+
+    def __init__(self, cutoff, skin=2.0):
+        """
+        initialization
+        :param cutoff: Largest contact distance between a protein atom and a ligand atom
+        :param skin: Distance kept in the list beyond the cutoff
+        """
+        self.cutoff = float(cutoff)
+        self.skin = float(skin)
+        self.protein, self.ligand, self.candidate = None, None, None
+        self.build = 0
+
+    def update(self, protein_info, coord, protein_index=None):
+        """
+        Give the protein atoms of a frame that can be within the cutoff of a ligand atom
+        :param protein_info: Protein_atoms of the frame
+        :param coord: N x 3 array of the ligand coordinates of the frame
+        :param protein_index: Protein_index of the frame, built here when the list is rebuilt by default
+        :return: Ascending array of atom indices
+        """
+
+        # A pair closer than the cutoff now was closer than the cutoff and the skin at the last build, as long as the
+        # largest moves of a ligand atom and of a protein atom add up to less than the skin
+        if self.candidate is not None and len(coord) == len(self.ligand):
+            move = np.sqrt(((coord - self.ligand) ** 2).sum(axis=1)).max(initial=0)
+            if protein_info.coord is not self.protein:
+                move += np.sqrt(((protein_info.coord - self.protein) ** 2).sum(axis=1)).max(initial=0)
+            if move <= self.skin:
+                return self.candidate
+
+        # Rebuild the list from the cells around the ligand
+        index = protein_index if protein_index is not None else Protein_index(protein_info)
+        reach = self.cutoff + self.skin
+        candidate = index.query_box(coord.min(axis=0) - reach, coord.max(axis=0) + reach)
+        protein = protein_info.coord[candidate]
+        d = np.sqrt((protein[:, None, 0] - coord[None, :, 0]) ** 2 + (protein[:, None, 1] - coord[None, :, 1]) ** 2 + (
+                protein[:, None, 2] - coord[None, :, 2]) ** 2)
+        self.candidate = candidate[(d <= reach).any(axis=1)]
+        self.protein, self.ligand = protein_info.coord, coord
+        self.build += 1
+        if profiler is not None:
+            profiler.count(neighbor_builds=1)
+
+        return self.candidate
 
 
 class Get_info_tools(object):
@@ -42,12 +603,31 @@ class Get_info_tools(object):
     list_N = ["N.4", "N.3", "N.2", "N.1", "N.ar", "N.am", "N.pl3"]
     list_O = ["O.3", "O.2", "O.co2", "O.spc", "O.t3p"]
 
-    def __init__(self, file_name1, file_name2, num):
+    # Keep the parsed protein in a binary sidecar file and load it from there in later runs
+    protein_cache = False
+
+    # Keep only the protein residues within this margin (angstrom) of the box around all the ligands
+    pocket_margin, pocket_box = None, None
+
+    # Estimate the volume progressively until the 95% confidence half width (angstrom^3) or the seconds per ligand
+    # are reached, instead of on the fixed grid of the accuracy
+    volume_tolerance, volume_time = None, None
+
+    # Program for the xscore terms, "native" calculates them in process with Xscore_native
+    xscore_backend = "xscore"
+
+    # Batches read ahead while xscore and the ligand features run in threads of their own, 0 runs them in turn
+    pipeline_depth = 2
+
+    def __init__(self, file_name1, file_name2, num, jobs=1, xscore_jobs=0, xscore_timeout=None):
         """
         initialization
         :param file_name1: The name of the ligand file
         :param file_name2: The name of the protein file
         :param num: Accuracy of volume calculation
+        :param jobs: Number of processes for the ligand features
+        :param xscore_jobs: Number of concurrent xscore shards, 0 runs one xscore in the current directory
+        :param xscore_timeout: Seconds allowed for every xscore shard
         """
 
         self.atom = []
@@ -56,178 +636,726 @@ class Get_info_tools(object):
         self.ligand_name = []
         self.ligand_info, self.protein_info = [], []
         self.volume_list = []
+        self.volume_error = []
         self.amino_acid = []
         self.xscore = []
         self.accuracy = float(num)
+        self.jobs = int(jobs)
+        self.xscore_jobs = int(xscore_jobs)
+        self.xscore_timeout = xscore_timeout
         self.name1 = file_name1
         self.name2 = file_name2
-        self.get_file_info()
-        self.get_xscore(self.name1, self.name2)
+        if self.pipeline_depth <= 0:
+            self.get_file_info()
+            self.get_xscore_all()
+            return
+
+        # xscore reads the files by itself, so it runs in a thread while the ligand features are calculated, the pool
+        # is started before the thread
+        self.get_protein_info()
+        pool = self.open_pool() if self.jobs > 1 else None
+        try:
+            with ThreadPoolExecutor(1) as stage:
+                xscore = stage.submit(self.get_xscore_all)
+                self.get_ligand_info(pool)
+                xscore.result()
+        finally:
+            if pool is not None:
+                pool.terminate()
 
     def get_file_info(self):
         """
         Read the file information including ligand and proteins and save the necessary contents
         """
+        self.get_protein_info()
+        self.get_ligand_info()
 
-        # Get information on protein files
-        with open(f"{self.name2}", 'r') as fi:
-            while True:
-                content = fi.readline().strip()
-                if content == "":
-                    break
+    def get_ligand_info(self, pool=None):
+        """
+        Read the ligand file and calculate the features of every ligand
+        :param pool: Process pool from open_pool to reuse
+        """
 
-                # Read information includes: element type, amino acid belonging to, number of amino acid, 3D coordinates
-                if content[0:4] == "ATOM" or content[0:6] == "HETATM":
-                    temp_info = [content[12:16].strip(), content[16:20].strip(), content[22:27].strip(),
-                                 float(content[30:38].strip()), float(content[38:46].strip()),
-                                 float(content[46:54].strip())]
-                    self.protein_info.append(temp_info)
-            fi.close()
+        # Get information on ligand files, the atoms of every ligand are collected for the feature calculation
+        start = time.perf_counter()
+        ligand_list = []
+        for name, atom, ring, ligand, lines in self.read_ligand(self.name1):
+            self.ligand_name.append(name)
+            self.atom.append(atom)
+            self.ring.append(ring)
+            ligand_list.append(ligand)
+        if profiler is not None:
+            profiler.log("read_ligand", start, ligands=len(ligand_list))
 
-        # Get information on ligand files
-        with open(f"{self.name1}", 'r') as fi:
-            temp_info = []
-            read_state, exit_state, temp_num = 0, 0, 0
-            read_state_list = ["@<TRIPOS>BOND\n", "@<TRIPOS>MOLECULE\n", "@<TRIPOS>ATOM\n"]
-            while True:
-                content = fi.readline()
-
-                # Categorize what you want to read into various states
-                if content in read_state_list:
-                    read_state = read_state_list.index(content)
-
-                    # Use the "molecular" label as the cut-off point when a complete ligand is read
-                    # Launch tool for calculating ligand information
-                    if read_state == 1:
-                        if temp_info != []:
-                            self.volume_list.append(self.get_volume(temp_info))
-                            self.atom_polar.append(self.get_polar(temp_info))
-                            self.amino_acid.append(self.get_ami(temp_info))
-                        temp_info = []
-                        temp_num = 0
-                        exit_state = 0
+        # Launch tool for calculating ligand information
+        for volume, polar, ami, error in self.map_ligand(ligand_list, pool, self.ligand_name):
+            self.volume_list.append(volume)
+            self.atom_polar.append(polar)
+            self.amino_acid.append(ami)
+            self.volume_error.append(error)
+
+    def get_protein_info(self):
+        """
+        Read the protein file and index its atoms
+        """
+
+        # Get information on protein files, only around the ligands when a pocket margin is set
+        start = time.perf_counter()
+        box = self.pocket_box
+        if box is None and self.pocket_margin is not None and self.name1 is not None:
+            box = self.get_ligand_box([self.name1], self.pocket_margin)
+        if box is not None:
+
+            # xscore gets the trimmed protein file as well
+            self.protein_file = self.name2
+            self.name2 = os.path.join(get_work_path(), f"{len(os.listdir(get_work_path()))}_"
+                                                       f"{os.path.basename(self.protein_file)}")
+            self.protein_info = Protein_atoms.read_pocket(self.protein_file, box[0], box[1], self.name2)
+        else:
+            self.protein_info = Protein_atoms.read(self.name2, self.protein_cache)
+
+            # xscore reads plain text, so it gets a decompressed copy of a compressed protein file
+            self.name2 = get_plain_file(self.name2)
+
+        if profiler is not None:
+            start = profiler.log("parse_protein", start, protein_atoms=len(self.protein_info))
+
+        # Index the protein atoms once so that every ligand only looks at its own pocket
+        self.protein_index = Protein_index(self.protein_info)
+        if profiler is not None:
+            profiler.log("index_protein", start)
+        self.native = Xscore_native(self.protein_info, self.protein_index) if self.xscore_backend == "native" else None
+
+    @classmethod
+    def get_ligand_box(cls, file_list, margin):
+        """
+        Calculate the box around the atoms of all the ligands of some ligand files
+        :param file_list: List of names of ligand files
+        :param margin: Distance added on every side of the box
+        :return: lower and upper corner of the box, None without any ligand atom
+        """
+        low, high = None, None
+        for name in file_list:
+            for record in cls.read_ligand(name):
+                if len(record[3]) == 0:
                     continue
+                coord = record[3].coord
+                low = coord.min(axis=0) if low is None else np.minimum(low, coord.min(axis=0))
+                high = coord.max(axis=0) if high is None else np.maximum(high, coord.max(axis=0))
+        if low is None:
+            return None
 
-                # Get the name, number of atoms and number of rings of the ligand
-                if read_state == 1:
-                    temp_num += 1
-                    if temp_num == 1:
-                        self.ligand_name.append(content.strip())
-                    elif temp_num == 2:
-                        temp = content.strip().split()[0:2]
-                        self.atom.append(int(temp[0]))
-                        self.ring.append(int(temp[1]) - int(temp[0]) + 1)
-                        continue
+        return low - margin, high + margin
 
-                # Read the 3D coordinates and atom type of ligands
-                elif read_state == 2:
-
-                    # Catch exception and set two read methods
-                    try:
-                        temp_info.append(
-                            [float(content[16:26].strip()), float(content[26:36].strip()),
-                             float(content[36:46].strip()),
-                             content[46:53].strip()])
-                    except:
-                        list_content = content.strip().split()
-                        temp_info.append(
-                            [float(list_content[2]), float(list_content[3]), float(list_content[4]),
-                             list_content[5]])
-
-                # When the content cannot be read for twenty consecutive times, no longer read
-                if content == "":
-                    exit_state += 1
-                    if exit_state == 20:
-                        if temp_info == []:
-                            self.volume_list.append(0)
-                            self.atom_polar.append([0, 0])
-                            self.amino_acid.append([0, 0, 0, 0, 0])
-                            break
-                        self.volume_list.append(self.get_volume(temp_info))
-                        self.atom_polar.append(self.get_polar(temp_info))
-                        self.amino_acid.append(self.get_ami(temp_info))
-                        break
+    @classmethod
+    def read_ligand(cls, file_name):
+        """
+        Read the ligand file one ligand at a time
+        :param file_name: The name of the ligand file
+        :return: Generator of the name, number of atoms, number of rings, Ligand_atoms and
+                 lines of the ligand file of every ligand
+        """
+        with open_text(file_name) as fi:
+            yield from cls.parse_ligand(fi)
             fi.close()
 
-    def get_volume(self, ligand):
+    @classmethod
+    def parse_ligand(cls, content_list):
         """
-        Calculate the volume of the ligand
-        :param ligand: List of ligand molecule information
-        :return: The result of the calculation of the volume
+        Parse the lines of a ligand file one ligand at a time, taking the lines in blocks
+        :param content_list: Iterable of the lines of a ligand file, line endings included
+        :return: Generator of the name, number of atoms, number of rings, Ligand_atoms and
+                 lines of the ligand file of every ligand
         """
+        lines = None
+        content_list = iter(content_list)
+        for block in iter(lambda: list(islice(content_list, 1 << 16)), []):
 
-        # Save the three-dimensional coordinate information and the corresponding atom type respectively
-        a, b, c, d_atom = [], [], [], []
-        for i in ligand:
-            d_atom.append(self.dict_vdw_r.get(i[3], 0))
-        for i in ligand:
-            a.append([i[0], d_atom[ligand.index(i)]])
-            b.append([i[1], d_atom[ligand.index(i)]])
-            c.append([i[2], d_atom[ligand.index(i)]])
+            # Use the "molecular" label as the cut-off point when a complete ligand is read
+            start_list = [i for i, k in enumerate(block) if k == "@<TRIPOS>MOLECULE\n"]
+            if lines is not None:
+                lines.extend(block[:start_list[0]] if start_list != [] else block)
+            lines_list = []
+            for start, end in zip(start_list, start_list[1:] + [len(block)]):
+                if lines is not None:
+                    lines_list.append(lines)
+                lines = block[start:end]
+            yield from cls.parse_molecule_list(lines_list)
 
-        # Sort 3D coordinates by size respectively
-        a1 = sorted(a, key=lambda a: a[0], reverse=False)
-        b1 = sorted(b, key=lambda b: b[0], reverse=False)
-        c1 = sorted(c, key=lambda c: c[0], reverse=False)
+        if lines is not None:
+            yield from cls.parse_molecule_list([lines])
 
-        # Calculate the length, width and height of the ligand
-        len_x = round(a1[-1][0] - a1[0][0] + a1[-1][1] + a1[0][1], 4)
-        len_y = round(b1[-1][0] - b1[0][0] + b1[-1][1] + b1[0][1], 4)
-        len_z = round(c1[-1][0] - c1[0][0] + c1[-1][1] + c1[0][1], 4)
+    @classmethod
+    def parse_molecule_list(cls, lines_list):
+        """
+        Parse the lines of some ligands, the coordinates of all of them at once when the file is well-formed
+        :param lines_list: List of the lines of every ligand
+        :return: Generator of the name, number of atoms, number of rings, Ligand_atoms and
+                 lines of every ligand
+        """
+        try:
+            head_list = [cls.parse_head(i) for i in lines_list]
+            atom_list = [k for i in head_list for k in i[3]]
+            text = "".join([k[16:53] for k in atom_list])
+            if len(text) != 37 * len(atom_list):
+                raise ValueError("atom lines shorter than the fixed columns")
 
-        # Computational Ligand Center
-        self.center = [a1[0][0] - a1[0][1] + len_x * 0.5, b1[0][0] - b1[0][1] + len_y * 0.5,
-                       c1[0][0] - c1[0][1] + len_z * 0.5, max([len_x, len_y, len_z]) * 0.5]
+            # The coordinates and atom types stay in arrays, the types are stripped once for every distinct one
+            row = np.frombuffer(text.encode("ascii"), dtype=np.uint8).reshape(-1, 37)
+            coord = np.ascontiguousarray(row[:, :30]).view("S10").astype(np.float64).reshape(-1, 3)
+            kind, kind_code = np.unique(np.ascontiguousarray(row[:, 30:]).view("S7")[:, 0], return_inverse=True)
+            kind_names = [i.decode().strip() for i in kind]
+            kind_code = kind_code.reshape(-1)
 
-        # Determining the Accuracy of Calculations
-        count1 = int(len_x * self.accuracy // 1)
-        count2 = int(len_y * self.accuracy // 1)
-        count3 = int(len_z * self.accuracy // 1)
+        # Otherwise every ligand is read line by line, and a broken one fails where the line by line reader fails
+        except (ValueError, IndexError):
+            for lines in lines_list:
+                name, atom, ring, atom_list = cls.parse_head(lines)
+                yield name, atom, ring, Ligand_atoms.wrap(cls.parse_atom(atom_list)), lines
+            return
 
-        # Place the ligand in a 3D point set and count the points that fall inside the ligand
-        num = 0
-        count1 = int(len_x * self.accuracy // 1)
-        count2 = int(len_y * self.accuracy // 1)
-        count3 = int(len_z * self.accuracy // 1)
-        d = [a1[0][0] - a1[0][1] - 1, b1[0][0] - b1[0][1] - 1, c1[0][0] - c1[0][1] - 1]
-        for j1 in range(count1 + 1):
-            d[0] += ((len_x + 2) / count1)
-            for j2 in range(count2 + 1):
-                d[1] += (len_y + 2) / count2
-                for j3 in range(count3 + 1):
-                    d[2] += (len_z + 2) / count3
-                    for i in ligand:
-                        if (i[0] - d[0]) ** 2 + (i[1] - d[1]) ** 2 + (i[2] - d[2]) ** 2 <= d_atom[ligand.index(i)] ** 2:
-                            num += 1
-                            break
-                d[2] = c1[0][0] - c1[0][1]
-            d[1] = b1[0][0] - b1[0][1]
-        # Calculate volume
-        volume_t = (len_x + 2) * (len_y + 2) * (len_z + 2)
-        volume = round(num * volume_t / (count1 * count2 * count3), 3)
+        start = 0
+        for lines, (name, atom, ring, atom_list) in zip(lines_list, head_list):
+            end = start + len(atom_list)
+            yield name, atom, ring, Ligand_atoms(coord[start:end], kind_code[start:end], kind_names), lines
+            start = end
 
-        return volume
+    @staticmethod
+    def parse_head(lines):
+        """
+        Find the name, the numbers and the atom lines of one ligand
+        :param lines: Lines of the ligand, from its "molecular" label on
+        :return: the name, number of atoms, number of rings and the atom lines of the ligand
+        """
+        name, atom, ring, atom_list = None, 0, 0, []
+        read_state_list = ["@<TRIPOS>BOND\n", "@<TRIPOS>MOLECULE\n", "@<TRIPOS>ATOM\n"]
 
-    def get_polar(self, ligand):
+        # Categorize what you want to read into various states, every state lasts until the next label
+        label_list = [i for i, k in enumerate(lines) if k in read_state_list]
+        for start, end in zip(label_list, label_list[1:] + [len(lines)]):
+            read_state = read_state_list.index(lines[start])
+
+            # Get the name, number of atoms and number of rings of the ligand
+            if read_state == 1:
+                if end - start > 1:
+                    name = lines[start + 1].strip()
+                if end - start > 2:
+                    temp = lines[start + 2].strip().split()[0:2]
+                    atom = int(temp[0])
+                    ring = int(temp[1]) - int(temp[0]) + 1
+
+            # The 3D coordinates and atom type of ligands
+            elif read_state == 2:
+                atom_list.extend(lines[start + 1:end])
+
+        return name, atom, ring, atom_list
+
+    @staticmethod
+    def parse_atom(atom_list):
         """
-        Count the number of nitrogen and oxygen atoms
-        :param ligand: List of ligand molecule information
-        :return: List of nitrogen and oxygen numbers
+        Parse the 3D coordinates and atom types of the atom lines of a ligand line by line
+        :param atom_list: List of the atom lines
+        :return: List of ligand molecule information
         """
-        num_N, num_O = 0, 0
-        for i in ligand:
-            if i[3] in self.list_N:
-                num_N += 1
-            elif i[3] in self.list_O:
-                num_O += 1
 
-        return [num_N, num_O]
+        # Catch exception and set two read methods
+        ligand = []
+        for content in atom_list:
+            try:
+                ligand.append([float(content[16:26].strip()), float(content[26:36].strip()),
+                               float(content[36:46].strip()), content[46:53].strip()])
+            except ValueError:
+                list_content = content.strip().split()
+                ligand.append([float(list_content[2]), float(list_content[3]), float(list_content[4]),
+                               list_content[5]])
+
+        return ligand
 
-    def get_ami(self, ligand):
+    @staticmethod
+    def parse_ligand_loop(content_list):
         """
-        Count and classify amino acids around ligands
-        :param ligand: List of ligand molecule information
-        :return: A list that records the number of four types of amino acids
+        Parse the lines of a ligand file one ligand at a time and atom by atom, kept as the reference for parse_ligand
+        :param content_list: Iterable of the lines of a ligand file, line endings included
+        :return: Generator of the name, number of atoms, number of rings, list of ligand molecule information and
+                 lines of the ligand file of every ligand
+        """
+        name, atom, ring, temp_info, lines = None, 0, 0, [], None
+        read_state, temp_num = 0, 0
+        read_state_list = ["@<TRIPOS>BOND\n", "@<TRIPOS>MOLECULE\n", "@<TRIPOS>ATOM\n"]
+        for content in content_list:
+            if content == "@<TRIPOS>MOLECULE\n":
+
+                # Use the "molecular" label as the cut-off point when a complete ligand is read
+                if lines is not None:
+                    yield name, atom, ring, temp_info, lines
+                name, atom, ring, temp_info, lines = None, 0, 0, [], []
+                temp_num = 0
+            if lines is not None:
+                lines.append(content)
+
+            # Categorize what you want to read into various states
+            if content in read_state_list:
+                read_state = read_state_list.index(content)
+                continue
+
+            # Get the name, number of atoms and number of rings of the ligand
+            if read_state == 1:
+                temp_num += 1
+                if temp_num == 1:
+                    name = content.strip()
+                elif temp_num == 2:
+                    temp = content.strip().split()[0:2]
+                    atom = int(temp[0])
+                    ring = int(temp[1]) - int(temp[0]) + 1
+
+            # Read the 3D coordinates and atom type of ligands
+            elif read_state == 2:
+
+                # Catch exception and set two read methods
+                try:
+                    temp_info.append(
+                        [float(content[16:26].strip()), float(content[26:36].strip()),
+                         float(content[36:46].strip()),
+                         content[46:53].strip()])
+                except:
+                    list_content = content.strip().split()
+                    temp_info.append(
+                        [float(list_content[2]), float(list_content[3]), float(list_content[4]),
+                         list_content[5]])
+
+        if lines is not None:
+            yield name, atom, ring, temp_info, lines
+
+    def get_ligand_feature(self, ligand):
+        """
+        Calculate the volume, polarity and amino acid environment of one ligand
+        :param ligand: List of ligand molecule information
+        :return: volume, list of nitrogen and oxygen numbers, list of amino acid numbers
+        """
+        if len(ligand) == 0:
+            return 0, [0, 0], [0, 0, 0, 0, 0], 0
+        if profiler is None:
+            volume, center, error = self.get_volume_estimate(ligand)
+            return volume, self.get_polar(ligand), self.get_ami(ligand, center), error
+
+        # Time every stage of the ligand for the profile
+        start = time.perf_counter()
+        volume, center, error = self.get_volume_estimate(ligand)
+        start = profiler.add("volume", start)
+        polar = self.get_polar(ligand)
+        start = profiler.add("polar", start)
+        ami = self.get_ami(ligand, center)
+        profiler.add("ami", start)
+
+        return volume, polar, ami, error
+
+    def get_ligand_profile(self, ligand):
+        """
+        Calculate the features of one ligand and take the profile records of its stages
+        :param ligand: List of ligand molecule information
+        :return: the features as given by get_ligand_feature, and the list of profile records
+        """
+        feature = self.get_ligand_feature(ligand)
+
+        return feature, profiler.take()
+
+    def open_pool(self):
+        """
+        Start a process pool whose workers hold this feature tool
+        :return: multiprocessing pool
+        """
+
+        # Forked workers share the parsed protein and its index with this process instead of receiving a copy
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+
+        return context.Pool(self.jobs, initializer=init_worker, initargs=(self,))
+
+    def map_ligand(self, ligand_list, pool=None, name_list=None):
+        """
+        Calculate the features of every ligand, in a process pool when more than one job is asked for
+        :param ligand_list: List of ligand molecule information
+        :param pool: Process pool from open_pool to reuse, one is started here when needed otherwise
+        :param name_list: List of the ligand names for the profile records, the positions by default
+        :return: List of the features of every ligand in order
+        """
+        if pool is None:
+            if self.jobs <= 1 or len(ligand_list) <= 1:
+                if profiler is None:
+                    return list(map(self.get_ligand_feature, ligand_list))
+                result = list(map(self.get_ligand_profile, ligand_list))
+            else:
+                with self.open_pool() as pool:
+                    return self.map_ligand(ligand_list, pool, name_list)
+        else:
+            chunk = max(1, len(ligand_list) // (self.jobs * 4))
+            result = pool.map(work_ligand, ligand_list, chunk)
+            if profiler is None:
+                return result
+
+        # The profile records come back with the features and are written where the ligand names are known
+        for i, (feature, row_list) in enumerate(result):
+            profiler.write(row_list, name_list[i] if name_list is not None else i)
+
+        return [i[0] for i in result]
+
+    def get_volume(self, ligand):
+        """
+        Calculate the volume of the ligand and keep its center for get_ami
+        :param ligand: List of ligand molecule information
+        :return: The result of the calculation of the volume
+        """
+        volume, self.center, error = self.get_volume_estimate(ligand)
+
+        return volume
+
+    @classmethod
+    def is_progressive(cls):
+        """
+        Tell whether the volume is estimated progressively
+        :return: True when a tolerance or time is set for the volume
+        """
+
+        return cls.volume_tolerance is not None or cls.volume_time is not None
+
+    @classmethod
+    def get_target(cls):
+        """
+        Give the labels of the result file
+        :return: A list of record labels, with the error of the volume at the end when it is estimated progressively
+        """
+
+        return target + ["volume_error"] if cls.is_progressive() else target
+
+    def get_volume_estimate(self, ligand):
+        """
+        Calculate the volume of the ligand on the grid, or progressively when a tolerance or time is set
+        :param ligand: List of ligand molecule information
+        :return: The volume, the center and half size of the ligand, and the error of the volume (None on the grid)
+        """
+        if not self.is_progressive():
+            return self.get_volume_center(ligand) + (None,)
+
+        return self.get_volume_progressive(ligand, self.volume_tolerance or 0, self.volume_time)
+
+    def get_bound(self, ligand):
+        """
+        Calculate the bounding box of the ligand including the van der Waals radius
+        :param ligand: List of ligand molecule information
+        :return: lower corner, length, width and height, center and half size, list of van der Waals radius
+        """
+
+        # The van der Waals radius of every atom, looked up once for every atom type
+        ligand = Ligand_atoms.wrap(ligand)
+        d_atom = ligand.get_value(self.dict_vdw_r)
+
+        # The lowest atom on an axis is the first of equal ones and the highest is the last, as a stable sort has them
+        low = ligand.coord.argmin(axis=0)
+        high = len(ligand) - 1 - ligand.coord[::-1].argmax(axis=0)
+
+        # Calculate the length, width and height of the ligand
+        start, size = [], []
+        for k in range(3):
+            a0, r0 = float(ligand.coord[low[k], k]), float(d_atom[low[k]])
+            a1, r1 = float(ligand.coord[high[k], k]), float(d_atom[high[k]])
+            size.append(round(a1 - a0 + r1 + r0, 4))
+            start.append(a0 - r0)
+
+        # Computational Ligand Center
+        center = [start[0] + size[0] * 0.5, start[1] + size[1] * 0.5, start[2] + size[2] * 0.5, max(size) * 0.5]
+
+        return start, size, center, d_atom
+
+    def get_volume_center(self, ligand):
+        """
+        Calculate the volume of the ligand on a NumPy occupancy grid
+        :param ligand: List of ligand molecule information
+        :return: The result of the calculation of the volume, and the center and half size of the ligand
+        """
+        ligand = Ligand_atoms.wrap(ligand)
+        start, (len_x, len_y, len_z), center, d_atom = self.get_bound(ligand)
+
+        # Determining the Accuracy of Calculations
+        count1 = int(len_x * self.accuracy // 1)
+        count2 = int(len_y * self.accuracy // 1)
+        count3 = int(len_z * self.accuracy // 1)
+
+        # Rebuild the grid axes in the same order the point walk of get_volume_loop visits them:
+        # the first x layer starts one step lower on y, and its first row one step lower on z
+        step = [(len_x + 2) / count1, (len_y + 2) / count2, (len_z + 2) / count3]
+        axis_x = self.grid_axis(start[0] - 1, step[0], count1 + 1)
+        axis_y0 = self.grid_axis(start[1] - 1, step[1], count2 + 1)
+        axis_y = self.grid_axis(start[1], step[1], count2 + 1)
+        axis_z0 = self.grid_axis(start[2] - 1, step[2], count3 + 1)
+        axis_z = self.grid_axis(start[2], step[2], count3 + 1)
+
+        # Count the points that fall inside the ligand
+        coord, radius = ligand.coord, d_atom
+        num = self.count_grid_points(coord, radius, axis_x[1:], axis_y, axis_z)
+        num += self.count_grid_points(coord, radius, axis_x[:1], axis_y0[1:], axis_z)
+        num += self.count_grid_points(coord, radius, axis_x[:1], axis_y0[:1], axis_z0)
+        if profiler is not None:
+            profiler.count(grid_points=(count1 + 1) * (count2 + 1) * (count3 + 1), grid_occupied=int(num))
+
+        # Calculate volume
+        volume_t = (len_x + 2) * (len_y + 2) * (len_z + 2)
+        volume = round(num * volume_t / (count1 * count2 * count3), 3)
+
+        return volume, center
+
+    def get_volume_progressive(self, ligand, tolerance, seconds=None, seed=0):
+        """
+        Estimate the volume of the ligand by stratified Monte Carlo sampling, adding samples round by round to the
+        strata on the surface of the ligand until the error is small enough or the time is up
+        :param ligand: List of ligand molecule information
+        :param tolerance: Half width of the 95% confidence interval to reach, in angstrom^3
+        :param seconds: Time allowed for the ligand, no limit by default
+        :param seed: Seed of the random numbers
+        :return: The volume, the center and half size of the ligand, and the half width of the 95% confidence interval
+        """
+        start_time = time.time()
+        ligand = Ligand_atoms.wrap(ligand)
+        center, radius = self.get_bound(ligand)[2:]
+        coord = ligand.coord
+        rng = np.random.default_rng(seed)
+
+        # Cut the box around every atom sphere into 8 x 8 x 8 strata of the same size
+        num = 8
+        start = (coord - radius[:, None]).min(axis=0)
+        size = ((coord + radius[:, None]).max(axis=0) - start) / num
+        corner = start + np.stack(np.meshgrid(*[np.arange(num)] * 3, indexing="ij"), -1).reshape(-1, 3) * size
+        volume_s = float(np.prod(size))
+        hit = np.zeros(len(corner))
+        count = np.zeros(len(corner))
+        todo = np.full(len(corner), 16)
+        while True:
+
+            # Sample the points of every stratum and count the ones inside an atom sphere
+            stratum = np.repeat(np.arange(len(corner)), todo)
+            for i in range(0, len(stratum), 8192):
+                part = stratum[i:i + 8192]
+                point = corner[part] + rng.random((len(part), 3)) * size
+                d = ((point[:, None, :] - coord[None, :, :]) ** 2).sum(axis=2)
+                np.add.at(hit, part, (d <= radius ** 2).any(axis=1))
+            count += todo
+
+            # The variance uses (hit + 1) / (count + 2) so that strata seen all inside or all outside still count
+            p = hit / count
+            p_var = (hit + 1) / (count + 2)
+            volume = volume_s * p.sum()
+            error = 1.96 * volume_s * sqrt(float((p_var * (1 - p_var) / count).sum()))
+            if error <= tolerance or (seconds is not None and time.time() - start_time >= seconds) \
+                    or count.sum() >= 2e7:
+                break
+
+            # Double the samples, giving each stratum a share in proportion to its standard deviation
+            weight = np.sqrt(p_var * (1 - p_var))
+            todo = np.ceil(count.sum() * weight / weight.sum()).astype(int)
+        if profiler is not None:
+            profiler.count(grid_points=int(count.sum()), grid_occupied=int(hit.sum()))
+
+        return round(float(volume), 3), center, round(error, 3)
+
+    @staticmethod
+    def grid_axis(start, step, num):
+        """
+        Generate the coordinates of one grid axis by repeatedly adding the step to the start
+        :param start: Coordinate before the first grid point
+        :param step: Distance between two grid points
+        :param num: Number of grid points
+        :return: Array of grid coordinates
+        """
+
+        # Accumulate sequentially so that the coordinates match the point walk bit for bit
+        return np.add.accumulate(np.concatenate(([start], np.full(num, step))))[1:]
+
+    @staticmethod
+    def count_grid_points(coord, radius, axis_x, axis_y, axis_z):
+        """
+        Count the grid points covered by at least one atom sphere
+        :param coord: Array of atom coordinates
+        :param radius: Array of atom van der Waals radius
+        :param axis_x: Ascending grid coordinates on x
+        :param axis_y: Ascending grid coordinates on y
+        :param axis_z: Ascending grid coordinates on z
+        :return: Number of occupied grid points
+        """
+        grid = np.zeros((len(axis_x), len(axis_y), len(axis_z)), dtype=bool)
+        if grid.size == 0:
+            return 0
+
+        # Each atom only marks the sub-box that bounds its own sphere
+        for (x, y, z), r in zip(coord, radius):
+            i0, i1 = np.searchsorted(axis_x, [x - r - 1e-6, x + r + 1e-6])
+            j0, j1 = np.searchsorted(axis_y, [y - r - 1e-6, y + r + 1e-6])
+            k0, k1 = np.searchsorted(axis_z, [z - r - 1e-6, z + r + 1e-6])
+            if i0 == i1 or j0 == j1 or k0 == k1:
+                continue
+            dx = (x - axis_x[i0:i1]) ** 2
+            dy = (y - axis_y[j0:j1]) ** 2
+            dz = (z - axis_z[k0:k1]) ** 2
+            grid[i0:i1, j0:j1, k0:k1] |= dx[:, None, None] + dy[None, :, None] + dz[None, None, :] <= r ** 2
+
+        return int(np.count_nonzero(grid))
+
+    def get_volume_loop(self, ligand):
+        """
+        Calculate the volume of the ligand by walking every grid point, kept as the reference for get_volume
+        :param ligand: List of ligand molecule information
+        :return: The result of the calculation of the volume
+        """
+
+        # Save the three-dimensional coordinate information and the corresponding atom type respectively
+        ligand = list(ligand)
+        a, b, c, d_atom = [], [], [], []
+        for i in ligand:
+            d_atom.append(self.dict_vdw_r.get(i[3], 0))
+        for i in ligand:
+            a.append([i[0], d_atom[ligand.index(i)]])
+            b.append([i[1], d_atom[ligand.index(i)]])
+            c.append([i[2], d_atom[ligand.index(i)]])
+
+        # Sort 3D coordinates by size respectively
+        a1 = sorted(a, key=lambda a: a[0], reverse=False)
+        b1 = sorted(b, key=lambda b: b[0], reverse=False)
+        c1 = sorted(c, key=lambda c: c[0], reverse=False)
+
+        # Calculate the length, width and height of the ligand
+        len_x = round(a1[-1][0] - a1[0][0] + a1[-1][1] + a1[0][1], 4)
+        len_y = round(b1[-1][0] - b1[0][0] + b1[-1][1] + b1[0][1], 4)
+        len_z = round(c1[-1][0] - c1[0][0] + c1[-1][1] + c1[0][1], 4)
+
+        # Computational Ligand Center
+        self.center = [a1[0][0] - a1[0][1] + len_x * 0.5, b1[0][0] - b1[0][1] + len_y * 0.5,
+                       c1[0][0] - c1[0][1] + len_z * 0.5, max([len_x, len_y, len_z]) * 0.5]
+
+        # Determining the Accuracy of Calculations
+        count1 = int(len_x * self.accuracy // 1)
+        count2 = int(len_y * self.accuracy // 1)
+        count3 = int(len_z * self.accuracy // 1)
+
+        # Place the ligand in a 3D point set and count the points that fall inside the ligand
+        num = 0
+        count1 = int(len_x * self.accuracy // 1)
+        count2 = int(len_y * self.accuracy // 1)
+        count3 = int(len_z * self.accuracy // 1)
+        d = [a1[0][0] - a1[0][1] - 1, b1[0][0] - b1[0][1] - 1, c1[0][0] - c1[0][1] - 1]
+        for j1 in range(count1 + 1):
+            d[0] += ((len_x + 2) / count1)
+            for j2 in range(count2 + 1):
+                d[1] += (len_y + 2) / count2
+                for j3 in range(count3 + 1):
+                    d[2] += (len_z + 2) / count3
+                    for i in ligand:
+                        if (i[0] - d[0]) ** 2 + (i[1] - d[1]) ** 2 + (i[2] - d[2]) ** 2 <= d_atom[ligand.index(i)] ** 2:
+                            num += 1
+                            break
+                d[2] = c1[0][0] - c1[0][1]
+            d[1] = b1[0][0] - b1[0][1]
+        # Calculate volume
+        volume_t = (len_x + 2) * (len_y + 2) * (len_z + 2)
+        volume = round(num * volume_t / (count1 * count2 * count3), 3)
+
+        return volume
+
+    def get_polar(self, ligand):
+        """
+        Count the number of nitrogen and oxygen atoms
+        :param ligand: List of ligand molecule information
+        :return: List of nitrogen and oxygen numbers
+        """
+        ligand = Ligand_atoms.wrap(ligand)
+        num_N, num_O = 0, 0
+        for kind, count in zip(ligand.kind_names, np.bincount(ligand.kind_code, minlength=len(ligand.kind_names))):
+            if kind in self.list_N:
+                num_N += int(count)
+            elif kind in self.list_O:
+                num_O += int(count)
+
+        return [num_N, num_O]
+
+    def get_ami(self, ligand, center=None):
+        """
+        Count and classify amino acids around ligands with radius queries on the protein index
+        :param ligand: List of ligand molecule information
+        :param center: Center and half size of the ligand, the one kept by get_volume by default
+        :return: A list that records the number of four types of amino acids
+        """
+        if center is None:
+            center = self.center
+        index = self.protein_index
+        ligand = Ligand_atoms.wrap(ligand)
+        coord = ligand.coord
+        cutoff = 2.5 + ligand.get_value(self.dict_vdw_r)
+
+        # Only the protein atoms in cells around the ligand can be in contact with it
+        candidate = index.query_box(coord.min(axis=0) - cutoff.max(), coord.max(axis=0) + cutoff.max())
+
+        return self.get_ami_candidate(coord, cutoff, center, candidate, index.coord)
+
+    def get_ami_candidate(self, coord, cutoff, center, candidate, protein_coord):
+        """
+        Count and classify the amino acids of the protein atoms in contact with the ligand among some candidates
+        :param coord: N x 3 array of the ligand coordinates
+        :param cutoff: Array of the contact distance of every ligand atom
+        :param center: Center and half size of the ligand
+        :param candidate: Ascending array of the protein atoms that can be in contact
+        :param protein_coord: N x 3 array of the coordinates of all the protein atoms
+        :return: A list that records the number of four types of amino acids
+        """
+        index = self.protein_index
+        protein = protein_coord[candidate]
+
+        # Obtain protein information around ligands to simplify calculations
+        d = np.sqrt((protein[:, 0] - center[0]) ** 2 + (protein[:, 1] - center[1]) ** 2 + (
+                protein[:, 2] - center[2]) ** 2)
+        in_pocket = d < center[3] + 3
+        candidate, protein = candidate[in_pocket], protein[in_pocket]
+        if profiler is not None:
+            profiler.count(pocket_atoms=len(candidate), contact_pairs=len(candidate) * len(coord))
+
+        # Record the 2.5 angstroms of amino acids around the ligand
+        d = np.sqrt((protein[:, None, 0] - coord[None, :, 0]) ** 2 + (protein[:, None, 1] - coord[None, :, 1]) ** 2 + (
+                protein[:, None, 2] - coord[None, :, 2]) ** 2)
+        di = {}
+        for k in candidate[(d <= cutoff[None, :]).any(axis=1)]:
+
+            # Prevent amino acid duplication records
+            di[index.res_ids[index.res_id[k]]] = index.res_names[index.res_name[k]]
+
+        return self.count_ami(di)
+
+    def count_ami(self, di):
+        """
+        Count the number of various amino acids according to the recorded labels
+        :param di: Dictionary from amino acid number to amino acid name
+        :return: A list that records the number of four types of amino acids
+        """
+        list_ami = [0, 0, 0, 0, 0]
+        for k, v in di.items():
+            a = self.dict_amino_acid.get(v, v)
+            if a == "A1":
+                list_ami[0] += 1
+            elif a == "B1":
+                list_ami[1] += 1
+            elif a == "B2":
+                list_ami[2] += 1
+            elif a == "B3":
+                list_ami[3] += 1
+            elif a == "H2O":
+                pass
+            else:
+                list_ami[4] += 1
+
+        return list_ami
+
+    def get_ami_loop(self, ligand):
+        """
+        Count and classify amino acids around ligands by scanning the whole protein, kept as the reference for get_ami
+        :param ligand: List of ligand molecule information
+        :return: A list that records the number of four types of amino acids
         """
         # Obtain protein information around ligands to simplify calculations
         center_protein_info = []
@@ -239,6 +1367,7 @@ class Get_info_tools(object):
                 center_protein_info.append(k)
 
         # Record the 2.5 angstroms of amino acids around the ligand
+        ligand = list(ligand)
         d_atom = []
         for i in ligand:
             d_atom.append(self.dict_vdw_r.get(i[3], 0))
@@ -255,24 +1384,17 @@ class Get_info_tools(object):
                     di[k[2]] = k[1]
                     break
 
-        # Count the number of various amino acids according to the recorded labels
-        list_ami = [0, 0, 0, 0, 0]
-        for k, v in di.items():
-            a = self.dict_amino_acid.get(v, v)
-            if a == "A1":
-                list_ami[0] += 1
-            elif a == "B1":
-                list_ami[1] += 1
-            elif a == "B2":
-                list_ami[2] += 1
-            elif a == "B3":
-                list_ami[3] += 1
-            elif a == "H2O":
-                pass
-            else:
-                list_ami[4] += 1
+        return self.count_ami(di)
 
-        return list_ami
+    def get_xscore_all(self):
+        """
+        Invoke xscore on the whole ligand file, in shards or at once in the current directory
+        :return: A list of records HMscore features
+        """
+        if self.xscore_jobs > 0 or self.xscore_backend == "native" or get_compression(self.name1) is not None:
+            return self.get_xscore_shard(self.name1, self.name2)
+
+        return self.get_xscore(self.name1, self.name2)
 
     def get_xscore(self, name1, name2):
         """
@@ -282,185 +1404,2277 @@ class Get_info_tools(object):
         :return: A list of records HMscore features
         """
 
-        # Call it directly and check if it is working properly
-        temp_path = os.getcwd()
-        if os.path.exists(f"{temp_path}/xscore.log"):
-            os.remove(f'{temp_path}/xscore.log')
-        try:
-            os.system(f"xscore -score {name2} {name1}")
-            if os.path.exists(f"{temp_path}/xscore.log") == False:
-                raise 1 / 0
-        except:
-            print("pleas input: python P3-Score_predict.py --help")
-            print("Please make sure your Xscore is running.")
+        # Call it directly and check if it is working properly
+        temp_path = os.getcwd()
+        if os.path.exists(f"{temp_path}/xscore.log"):
+            os.remove(f'{temp_path}/xscore.log')
+        begin = time.perf_counter()
+        try:
+            os.system(f"xscore -score {name2} {name1}")
+            if os.path.exists(f"{temp_path}/xscore.log") == False:
+                raise 1 / 0
+        except:
+            print("pleas input: python P3-Score_predict.py --help")
+            print("Please make sure your Xscore is running.")
+
+        # Read the features of HMscore
+        else:
+            xscore = self.read_xscore_log('xscore.log')
+            self.xscore.extend(xscore)
+            if profiler is not None:
+                profiler.log("xscore", begin, ligands=len(xscore))
+
+        return self.xscore
+
+    def get_xscore_shard(self, name1, name2):
+        """
+        Split the ligand file into shards and invoke xscore on them concurrently, each in a private directory
+        :param name1: The name of the ligand file
+        :param name2: The name of the protein file
+        :return: A list of records HMscore features
+        """
+
+        # Cut the ligand file at the "molecular" labels and deal the ligands out in contiguous shards
+        molecule_list = self.split_molecule(name1)
+        self.xscore.extend(self.score_molecule(os.path.abspath(name2), molecule_list, self.xscore_jobs * 4))
+
+        return self.xscore
+
+    @staticmethod
+    def split_molecule(file_name):
+        """
+        Cut a ligand file at the "molecular" labels
+        :param file_name: The name of the ligand file
+        :return: List of ligands, each a list of lines of the ligand file
+        """
+        molecule_list = []
+        with open_text(file_name) as fi:
+            for content in fi:
+                if content == "@<TRIPOS>MOLECULE\n" or molecule_list == []:
+                    molecule_list.append([])
+                molecule_list[-1].append(content)
+        if molecule_list != [] and molecule_list[0][0] != "@<TRIPOS>MOLECULE\n":
+            molecule_list.pop(0)
+
+        return molecule_list
+
+    def score_molecule(self, protein_file, molecule_list, shard_num, start=0, index_list=None, record_list=None):
+        """
+        Invoke xscore on contiguous shards of some ligands concurrently
+        :param protein_file: The absolute name of the protein file
+        :param molecule_list: List of ligands, each a list of lines of the ligand file
+        :param shard_num: Largest number of shards
+        :param start: Number of ligands before these ones in the ligand file, used in the error message
+        :param index_list: Index of every ligand in the ligand file, used in the error message instead of start when
+                           the ligands are not all in a row
+        :param record_list: The ligands as given by read_ligand, the native backend scores them without reading the
+                            lines again
+        :return: A list of records HMscore features in ligand order
+        """
+
+        # The native backend needs no program and scores from the parsed protein
+        begin = time.perf_counter()
+        if self.xscore_backend == "native":
+            if record_list is None:
+                record_list = [next(Get_info_tools.parse_ligand(k), None) for k in molecule_list]
+            xscore = self.native.score_batch(record_list)
+            if profiler is not None:
+                profiler.log("xscore", begin, ligands=len(molecule_list))
+            return xscore
+        if molecule_list == []:
+            return []
+        num = max(1, min(len(molecule_list), shard_num))
+        size = -(-len(molecule_list) // num)
+        shard_list = [molecule_list[i:i + size] for i in range(0, len(molecule_list), size)]
+
+        # Run the shards at the same time and merge the "Total" lines back in ligand order
+        with ThreadPoolExecutor(max(1, self.xscore_jobs)) as pool:
+            result = list(pool.map(lambda shard: self.run_xscore(protein_file, shard, self.xscore_timeout),
+                                   shard_list))
+        if index_list is None:
+            index_list = range(start, start + len(molecule_list))
+        xscore, error = [], []
+        for i, (temp, message) in enumerate(result):
+            if message is not None:
+                number = self.join_number([k + 1 for k in index_list[i * size:i * size + len(shard_list[i])]])
+                error.append(f"xscore shard {i + 1}/{len(shard_list)} (ligand {number}): {message}")
+            xscore.extend(temp)
+        if error != []:
+            raise RuntimeError("\n".join(error))
+        if profiler is not None:
+            profiler.log("xscore", begin, ligands=len(molecule_list), shards=len(shard_list))
+
+        return xscore
+
+    @staticmethod
+    def join_number(number_list):
+        """
+        Write increasing ligand numbers briefly, the numbers in a row as one range
+        :param number_list: List of increasing ligand numbers
+        :return: text such as "3 to 5, 9"
+        """
+        part = []
+        for k in number_list:
+            if part != [] and k == part[-1][1] + 1:
+                part[-1][1] = k
+            else:
+                part.append([k, k])
+
+        return ", ".join(f"{a} to {b}" if a != b else f"{a}" for a, b in part)
+
+    @classmethod
+    def run_xscore(cls, protein_file, molecule_list, timeout=None):
+        """
+        Invoke xscore on some ligands in a private temporary directory
+        :param protein_file: The absolute name of the protein file
+        :param molecule_list: List of ligands, each a list of lines of the ligand file
+        :param timeout: Seconds allowed for xscore
+        :return: A list of records HMscore features and the error message (None on success)
+        """
+        with tempfile.TemporaryDirectory(prefix="p3score_") as temp_path:
+            with open(f"{temp_path}/ligand.mol2", "w") as fi:
+                for molecule in molecule_list:
+                    fi.writelines(molecule)
+            try:
+                state = subprocess.run(["xscore", "-score", protein_file, "ligand.mol2"], cwd=temp_path,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+            except FileNotFoundError:
+                return [], "xscore is not found, please make sure your Xscore is running"
+            except subprocess.TimeoutExpired:
+                return [], f"xscore did not finish in {timeout} seconds"
+            if not os.path.exists(f"{temp_path}/xscore.log"):
+                message = state.stderr.decode(errors="replace").strip()
+                return [], f"xscore exited with code {state.returncode} and wrote no xscore.log {message}".strip()
+            xscore = cls.read_xscore_log(f"{temp_path}/xscore.log")
+
+        if len(xscore) != len(molecule_list):
+            return xscore, f"xscore reported {len(xscore)} ligands out of {len(molecule_list)}"
+        return xscore, None
+
+    @staticmethod
+    def read_xscore_log(file_name):
+        """
+        Read the features of HMscore from a log of xscore
+        :param file_name: The name of the log file
+        :return: A list of records HMscore features
+        """
+        xscore = []
+        with open(f"{file_name}", 'r') as fl:
+            count = 0
+            row = [1, 2, 4, 5, 6]
+            while True:
+                temp = []
+                content = fl.readline().strip().split()
+                if content == []:
+                    count += 1
+                    if count == 10:
+                        break
+                    continue
+                if content[0] == "Total":
+                    for i in row:
+                        temp.append(float(content[i]))
+                    xscore.append(temp)
+                    count = 0
+
+        return xscore
+
+
+class calc(object):
+    """
+    Provides the calculation of the scoring function
+    """
+    row = [0, 1, 2, 3, 4, 5, 8, 10, 11, 12, 13, 14, 15, 16, 17, 24, 25, 26, 27, 28, 31, 33, 38, 40, 41, 46, 47, 50,
+           61, 65, 66, 67, 68, 72, 74, 79, 86, 97, 100, 101, 103, 107, 108, 110, 111, 112, 115, 117, 119, 121, 128,
+           132, 136, 142, 143, 146, 148, 155, 170, 171, 172, 177, 182, 187, 192, 193, 199, 204, 205, 213, 216, 217,
+           219, 233, 236, 243, 258, 264, 270, 274, 278, 283, 289, 291, 295, 300, 304, 311, 312, 321, 336, 345, 346,
+           348, 354, 358, 359, 360, 361, 372, 375, 376, 384, 385, 399, 403, 413, 427, 433, 435, 458, 478, 479, 480,
+           481, 482, 485, 489, 492, 497, 506, 512, 521, 524, 537, 541, 542, 550, 554, 557, 563, 566, 570, 572, 573,
+           575, 584, 589, 590, 606, 609, 611, 623, 637, 639, 651, 655, 662, 670, 671, 676]
+    scale0 = [227.55524632769988, 2.973228393473277, 2.0126773360994417, 129.8330860295337, 4.716392837993995,
+              151.50695268073721, 3.9224218409893914, 2.950142076415521, 1.6614690589883119, 1.472453623203242,
+              0.4882252141187505, 296675.8439772615, 2390.585187665551, 1844.5247606647386, 126551.3094327611,
+              2781.9925309489317, 1200.2875208040216, 1236.9258170988335, 234.5213735988161, 34.848395928370635,
+              38.28959896573556, 9.908179313924798, 15.157885561767685, 3.1399184173117693, 13.483313120870669,
+              11.083426240261288, 14.053004473222394, 5.630752038827854, 430.45563705487973, 3080.322669159909,
+              16.758951023934355, 38.24044782306181, 55.55321832654137, 17.540759707131766, 119895.36813987223,
+              1660.872858871134, 17.723170667216927, 1.505586271857734, 34.54530005320871, 19.0859676245226,
+              3.074722028186388, 15.168746823178392, 2.79303047189354, 12.74564108451648, 11.426149161016449,
+              2.673848858265198, 1.8490945014514202, 1.504661188139918, 337087085.34892535, 1898412.207337988,
+              3629291.810627584, 158097.42547301843, 38041.15412350887, 25488.76082780236, 11978.258191779978,
+              12882.741362166946, 27383.387475175983, 4764.707067539868, 3151660.860778027, 16602.493300107413,
+              38029.23300803305, 17682.50323776452, 2088428.413472216, 85752.29091970452, 12689.70548282853,
+              5000.737185630874, 22788.134660142245, 31859.780924320174, 31943.39541565111, 1595.0785494253412,
+              10518.378756567166, 1672.0125274474592, 4195.299746673912, 325.28685635203124, 31.6595226589258,
+              94.13719747034624, 2847.482400295553, 497.79685456422715, 909269.7764155063, 13400.548200964617,
+              960.9263382086389, 92.08209189171593, 173.1215184528277, 81.62428759447226, 290.3434346393887,
+              289.94943860858274, 17.141769579683107, 13.81196428429597, 53.02325948657239, 91.72734933992824,
+              2822.275151812391, 71.50807438854775, 89.02412113751599, 766302.3128652817, 2990.3689415692647,
+              47.57130476186433, 57.51867035356248, 101.74935312625712, 60.848408879205785, 141.8257067690038,
+              41.585121972204846, 47.24760746026051, 42.49196546813215, 49.05464651925387, 762222.4110814757,
+              18963.919804205874, 598.5427333391859, 4392.3774656091455, 8412.96537484996, 2330.592429156345,
+              122.10235672885506, 85.08967381360814, 110.72095304127103, 198.64174073350821, 169.75195524146616,
+              138.6179844046895, 6.8696045599333475, 386.3481025375999, 13.888196762274807, 183.67948603482253,
+              161.8255969694386, 9.653872763918685, 463928.2365132873, 5953.249754497957, 574.95880618938,
+              9526.664892671424, 7463.851039868166, 6342.460412876236, 2376.4686690119074, 408.57357248607127,
+              77.99926364280881, 3.883247248946046, 94.15015204908993, 32.984845447234825, 4.328000320838915,
+              139.54798040763157, 7.587530567862162, 32.115606622121255, 16.78428983496099, 74.80566582195964,
+              203.3576732822364, 93.19774428879137, 1413.5764825137435, 22.40417729428934, 56.737323470894786,
+              109.22148157601208, 10.30571517329792, 23.355889631818858, 31.283356349891193, 9.900689466784234,
+              6.946949396305995]
+    mean0 = [563.3200582100416, 3.9995149163230623, 2.2696361872422983, 171.9067911714767, 5.038927965073976,
+             319.1441314576769, 4.9975745816153285, 5.459131700218288, 2.1765704584040746, 1.851564394858113,
+             0.22580645161290322, 369110.87811302475, 2411.8634804753865, 1538.6111869997574, 114956.53021343648,
+             3323.6922144069854, 1252.3133883094838, 1174.374193548384, 102.45590589376654, 24.836206645646264,
+             25.349248120300807, 9.529105020616063, 10.753965559058953, 1.130244967256852, 9.202118481688144,
+             7.85629396070822, 10.267501819063789, 4.363870967741932, 350.82789231142374, 2140.9271633519297,
+             13.531772980839195, 20.659228716953674, 34.80875576036866, 11.367329614358477, 124807.33335447781,
+             1860.1889219015306, 19.708949793839437, 0.5556633519282076, 29.756973077855932, 13.1040504487024,
+             1.1695367450885277, 13.04487024011642, 1.2131942760126122, 12.067911714770798, 10.692456948823672,
+             1.0904681057482415, 0.7613388309483385, 0.4921173902498181, 273765279.98989236, 1176401.236311038,
+             3020734.1879674965, 55241.341380063146, 18809.429282076133, 16290.902626728137, 6641.46239631336,
+             6923.476831414035, 12157.433113509594, 2985.706025709434, 1675024.4062378625, 10457.76517099199,
+             16271.67815910742, 8788.523878243981, 1334924.306302936, 30371.79026808148, 10215.338782439969,
+             3577.6517099199586, 13551.245282561218, 23116.307324763577, 20076.624011642005, 601.5072277467868,
+             7245.341207858341, 564.4970652437544, 2627.3635217074934, 170.82125151588687, 8.050443851564392,
+             43.59910308028131, 1424.412437545475, 217.8332524860539, 566047.8540014391, 9672.858692117392,
+             313.71858763036664, 61.32794081979135, 100.02420567547902, 37.38120300751886, 172.37863206403065,
+             209.5282803783656, 5.836623817608537, 4.064807179238416, 28.037181663836996, 44.56167278680574,
+             1326.6257674023773, 30.996592287169594, 36.49887460586955, 433833.6814629463, 1798.211552255639,
+             27.508273102110092, 33.66864176570464, 64.66860053359214, 39.60736114479736, 68.63499636187228,
+             21.784292990540788, 22.882325976230923, 24.305212224108622, 25.405748241571608, 422018.00029347645,
+             5271.970004850836, 147.87365995634246, 2990.2519282076178, 4943.090565122483, 1239.1602231384916,
+             34.205748241571676, 51.967620664564635, 58.8254911472229, 97.0158864904196, 109.05760368663594,
+             83.84210526315789, 1.8828522920203734, 144.60938636914867, 3.2667960223138492, 82.8649041959738,
+             73.9140189182634, 2.475624545234053, 285101.19398070674, 4045.67643099685, 172.61789328159094,
+             4914.601451612912, 4165.38503080282, 4292.399211253935, 1460.8416606839692, 128.5282813485326,
+             55.6871210283774, 1.0434149890856173, 60.55687606112054, 20.93233082706767, 1.2318699975745817,
+             99.12563667232598, 2.4319670143099685, 17.641280620907107, 10.533349502789232, 36.676206645646374,
+             137.1290322580645, 51.88552025224351, 453.93524132912927, 6.615086102352656, 26.63667232597623,
+             75.29177783167596, 4.107203492602474, 6.793111811787534, 14.645646373999515, 3.14649527043415,
+             1.7125879214164443]
+    coef = [1.1441663782499432, 0.6362632563970597, 0.33253447912590384, -0.18331956732261662, 0.32611170095566766,
+            0.21370181260429325, -0.22620778244896292, 0.01748181869439621, 0.14748592890410492, 0.013837389850036769,
+            0.2284668633423691, 0.30094884843060427, -0.34522835263792523, 0.19535978463960862, 0.4784858981554066,
+            -0.037227232420745174, -0.1709838878603382, 0.26100767195978863, -0.24471936484221868, -0.0411826799569834,
+            -0.33557623945614046, 0.20556589162253705, -0.2034684186312401, 0.3354167880118972, -0.24637761212732867,
+            0.20894505878650657, 0.5177536306901687, 0.17867247231744113, -0.056550480542314326, -0.34220016044803697,
+            -0.35759795974338227, -0.7561972422887501, -0.03923279437949557, -0.28828176640057557, -0.16810059209701209,
+            -0.2457057081107467, 0.33475447658651525, 0.24020531697399522, 0.05812973242990665, -0.21574986656403236,
+            -0.4444867559025378, 0.1798627080179703, 0.3257855317069273, -0.14224135716212, 0.18236229625179967,
+            0.5488065919350236, 0.15648922285203348, -0.2985823268522644, -0.23209465259466497, -0.23400493641989356,
+            -0.34602532153462967, -0.3024298582344142, 0.08568464720672193, -0.15487644296087474, 0.09245386770235073,
+            -0.3079387382437739, -0.21289176740691554, -0.026202414557244164, -0.18077482380563795, 0.2481902543044735,
+            0.49791030283794085, 0.4733864185797321, -0.1266317220860125, 0.3623946261861203, 0.19299131215823448,
+            0.16273826946940367, -0.1709328305033089, 0.17948218886859266, -0.13909485283748962, -0.3311184518395256,
+            -0.011555420400063817, -0.15552547575805323, -0.21286340241931345, 0.394750693007009, -0.26892137725519444,
+            -0.15568293975676814, -0.20289903577712573, 0.06461356990603107, 0.21267687039845123, 0.17333207362528094,
+            0.23803409599011882, -0.35198261612962684, -0.5099845148381258, 0.2342643844683067, -0.41655426104968374,
+            0.23503975555916493, -0.2963956285579127, 0.16778712576240448, 0.17428585770150512, 0.4005703106463118,
+            -0.3400071763981737, -0.08684607815372794, 0.3330292358292457, 0.017130454666645468, -0.27501765825975344,
+            0.08308075784670002, -0.1902949948715159, -0.2603409229578681, -0.08210247207272314, -0.12134044482440598,
+            -0.17174508179634543, 0.42705354592343203, 0.2585788961713932, -0.1896116240867361, 0.15089675951330955,
+            -0.2684555328237243, 0.15560550133832685, 0.1759904382599455, -0.40913202430899603, -0.1077637481815873,
+            -0.050932256856665706, -0.06946997360000177, 0.2220797691961497, 0.10161301470311854, 0.25288434173999225,
+            -0.14126628663968294, -0.0773046080507367, 0.16343507568291898, -0.23499606284633812, 0.35034408135430906,
+            -0.15392774371317683, 0.1433633023730116, -0.04873045770896722, 0.06960522278792992, 0.10392744519097917,
+            0.63033080636774, -0.35266328578514616, 0.14256599497178377, -0.04056136955217704, 0.1483629938091759,
+            0.07343473843474249, -0.14359719969936524, -0.09667304649129936, -0.09605202635556305, -0.24545620796243228,
+            -0.35702824905195396, 0.4698884097131349, -0.20172520267926403, 0.09474665131798554, -0.04915413846172816,
+            0.5812404219989707, 0.10352389578923392, 0.1762901752874345, 0.21422338283614653, -0.4885168791704469,
+            -0.36325720696925035, 0.2666496877427053, -0.2908737215608939, 0.36613674115710576, -0.25534977122701547,
+            -0.1812676960508424, 6.388217317487271]
+
+    # Feature indices of the selected terms and the folded weights, compiled once by get_terms
+    terms, weight, bias, num = None, None, None, None
+
+    def __int__(self):
+        pass
+
+    @classmethod
+    def get_terms(cls, num=14):
+        """
+        Compile the selected terms into index arrays and fold the standardization into the weights
+        :param num: number of features
+        :return: index array of the terms, weight vector and bias
+        """
+        if cls.terms is None or cls.num != num:
+
+            # Enumerate the terms in the same order as get_predict_loop, index num stands for the constant 1
+            all_terms = [(i, num, num) for i in range(num)]
+            all_terms.extend((i, j, num) for i in range(num) for j in range(i, num))
+            all_terms.extend((i, j, k) for i in range(num) for j in range(i, num) for k in range(j, num))
+            cls.terms = np.array([all_terms[i] for i in cls.row], dtype=int)
+
+            # ((x - mean0) / scale0) * coef summed up equals x @ (coef / scale0) + bias
+            coef = np.array(cls.coef[:-1], dtype=float)
+            scale0 = np.array(cls.scale0, dtype=float)
+            mean0 = np.array(cls.mean0, dtype=float)
+            cls.weight = coef / scale0
+            cls.bias = float(cls.coef[-1]) - float(np.sum(mean0 * cls.weight))
+            cls.num = num
+
+        return cls.terms, cls.weight, cls.bias
+
+    @classmethod
+    def expand(cls, features):
+        """
+        Extend and trim a matrix of features into the selected terms
+        :param features: N x 14 matrix of features
+        :return: N x 151 matrix of terms
+        """
+        terms = cls.get_terms(features.shape[1])[0]
+        features = np.hstack([features, np.ones((features.shape[0], 1))])
+
+        return features[:, terms[:, 0]] * features[:, terms[:, 1]] * features[:, terms[:, 2]]
+
+    @classmethod
+    def get_predict_batch(cls, features):
+        """
+        Predicting binding energy for many ligands at once
+        :param features: N x 14 matrix (or list of lists) of features
+        :return: array of predicted binding energy
+        """
+        features = np.asarray(features, dtype=float)
+        if features.size == 0:
+            return np.zeros(0)
+        expand_features = cls.expand(features)
+        terms, weight, bias = cls.get_terms(features.shape[1])
+        predict = expand_features @ weight + bias
+
+        # The folded sum differs from the sequential one in the last bits, so redo the ones next to a rounding tie
+        tie = np.abs((predict * 1e4) % 1 - 0.5) < 1e-4
+        if tie.any():
+            term = (expand_features[tie] - cls.mean0) / cls.scale0 * cls.coef[:-1]
+            predict[tie] = np.add.accumulate(term, axis=1)[:, -1] + float(cls.coef[-1])
+
+        return np.array([round(i, 4) for i in predict.tolist()])
+
+    @classmethod
+    def get_predict(cls, features):
+        """
+        Predicting binding energy from features
+        :param features: a list of record features
+        :return: predicted binding energy
+        """
+
+        return float(cls.get_predict_batch([features])[0])
+
+    @classmethod
+    def get_predict_loop(cls, features):
+        """
+        Predicting binding energy from features one term at a time, kept as the reference for get_predict_batch
+        :param features: a list of record features
+        :return: predicted binding energy
+        """
+
+        # Extend and trim features
+        num = len(features)
+        expand_features = []
+        expand_features.extend(features[0:4])
+
+        count = 3
+        for i in range(4, num):
+            count += 1
+            if count in cls.row:
+                expand_features.append(features[i])
+        for i in range(num):
+            for j in range(i, num):
+                count += 1
+                if count in cls.row:
+                    expand_features.append(features[i] * features[j])
+        for i in range(num):
+            for j in range(i, num):
+                for k in range(j, num):
+                    count += 1
+                    if count in cls.row:
+                        expand_features.append(features[i] * features[j] * features[k])
+
+        # Calculate the corresponding data
+        predict = 0
+        for i in range(len(expand_features)):
+            predict += ((expand_features[i] - cls.mean0[i]) / cls.scale0[i]) * float(cls.coef[i])
+        predict += float(cls.coef[-1])
+
+        return round(predict, 4)
+
+
+class Xscore_native(object):
+    """
+    Calculate the VDW, HB, HM, HS and RT terms of xscore in process with NumPy. The terms follow the published forms
+    of X-Score with a simpler atom typing: hydrogen bonds have no angle factor and the hydrophobic match counts atoms
+    instead of their logP, so the values follow xscore closely but not exactly
+    """
+
+    # van der Waals radii of the terms, other heavy elements use 1.8
+    dict_radius = {"C": 1.9, "N": 1.8, "O": 1.7, "S": 2.0, "P": 2.1, "F": 1.5, "Cl": 1.8, "Br": 2.0, "I": 2.2}
+
+    # Hydrogen bond donors and acceptors of amino acids besides the backbone N and O
+    dict_donor = {"SER": ["OG"], "THR": ["OG1"], "TYR": ["OH"], "ASN": ["ND2"], "GLN": ["NE2"], "LYS": ["NZ"],
+                  "ARG": ["NE", "NH1", "NH2"], "HIS": ["ND1", "NE2"], "TRP": ["NE1"], "HOH": ["O"]}
+    dict_acceptor = {"SER": ["OG"], "THR": ["OG1"], "TYR": ["OH"], "ASN": ["OD1"], "GLN": ["OE1"],
+                     "ASP": ["OD1", "OD2"], "GLU": ["OE1", "OE2"], "HIS": ["ND1", "NE2"], "HOH": ["O"]}
+
+    # Carbon atoms of amino acids bonded to nitrogen or oxygen besides the backbone C and CA, and hydrophobic sulfur
+    dict_polar_carbon = {"SER": ["CB"], "THR": ["CB"], "TYR": ["CZ"], "ASP": ["CG"], "GLU": ["CD"], "ASN": ["CG"],
+                         "GLN": ["CD"], "LYS": ["CE"], "ARG": ["CD", "CZ"], "HIS": ["CG", "CD2", "CE1"],
+                         "TRP": ["CD1", "CE2"], "PRO": ["CD"]}
+    dict_sulfur = {"MET": ["SD"], "CYS": ["SG"]}
+
+    # Cutoffs of the terms in angstroms
+    vdw_cutoff, hm_cutoff, probe = 8.0, 6.0, 1.4
+
+    # Coefficients that turn the terms into their -log(Kd) contributions as xscore reports them, the HB and RT ones
+    # are the mean of the HPScore, HMScore and HSScore fits of X-Score
+    weight = {"VDW": 0.004, "HB": 0.076, "HM": 0.387, "HS": 0.004, "RT": -0.083}
+
+    def __init__(self, protein_info, protein_index):
+        """
+        initialization, the protein atoms are typed once
+        :param protein_info: Protein_atoms
+        :param protein_index: Protein_index of the same atoms
+        """
+        self.index = protein_index
+        self.coord = protein_info.coord
+        name = [protein_info.atom_names[i] for i in protein_info.atom_code]
+        res = [protein_info.res_names[i] for i in protein_info.res_name_code]
+        element = [i.lstrip("0123456789")[:1] for i in name]
+        self.heavy = np.array([i not in ("H", "") for i in element], dtype=bool)
+        self.radius = np.array([self.dict_radius.get(i, 1.8) for i in element])
+        self.polar = np.array([i in ("N", "O") for i in element], dtype=bool)
+        self.donor = np.array([(n == "N" and r != "PRO") or n in self.dict_donor.get(r, ())
+                               for n, r in zip(name, res)], dtype=bool)
+        self.acceptor = np.array([n in ("O", "OXT") or n in self.dict_acceptor.get(r, ())
+                                  for n, r in zip(name, res)], dtype=bool)
+        self.hydrophobic = np.array([(e == "C" and n not in ("C", "CA") and n not in self.dict_polar_carbon.get(r, ()))
+                                     or n in self.dict_sulfur.get(r, ()) for e, n, r in zip(element, name, res)],
+                                    dtype=bool)
+
+        # Points spread evenly over a unit sphere for the solvent accessible surface
+        num = 96
+        z = 1 - (2 * np.arange(num) + 1) / num
+        phi = np.arange(num) * np.pi * (3 - np.sqrt(5))
+        self.sphere = np.stack([np.sqrt(1 - z ** 2) * np.cos(phi), np.sqrt(1 - z ** 2) * np.sin(phi), z], axis=1)
+
+    def move(self, protein_info, protein_index):
+        """
+        Score with the typing of these atoms at the coordinates of another frame
+        :param protein_info: Protein_atoms of the same atoms at other coordinates
+        :param protein_index: Protein_index of the other coordinates
+        :return: Xscore_native
+        """
+        native = copy.copy(self)
+        native.coord, native.index = protein_info.coord, protein_index
+
+        return native
+
+    @staticmethod
+    def read_bond(content_list, atom_num):
+        """
+        Read the bonds of one ligand
+        :param content_list: Lines of the ligand in mol2 format
+        :param atom_num: Number of atoms of the ligand
+        :return: List of the two atom indices and the bond type of every bond
+        """
+        bond, read_state = [], False
+        for content in content_list:
+            if content.startswith("@<TRIPOS>"):
+                read_state = content.strip() == "@<TRIPOS>BOND"
+                continue
+            temp = content.split()
+            if read_state and len(temp) >= 4 and 0 < int(temp[1]) <= atom_num and 0 < int(temp[2]) <= atom_num:
+                bond.append((int(temp[1]) - 1, int(temp[2]) - 1, temp[3]))
+
+        return bond
+
+    @staticmethod
+    def count_rotor(bond, neighbor, heavy):
+        """
+        Count the single bonds out of rings between two heavy atoms that both have another heavy neighbor
+        :param bond: List of the two atom indices and the bond type of every bond
+        :param neighbor: List of the neighbor indices of every atom
+        :param heavy: Whether every atom is a heavy atom
+        :return: Number of rotatable bonds
+        """
+        count = 0
+        for a, b, kind in bond:
+            if kind != "1" or not heavy[a] or not heavy[b]:
+                continue
+            if sum(heavy[i] for i in neighbor[a]) < 2 or sum(heavy[i] for i in neighbor[b]) < 2:
+                continue
+
+            # The bond is in a ring when b can still be reached from a without it
+            seen, todo = {a}, [i for i in neighbor[a] if i != b]
+            while todo:
+                i = todo.pop()
+                if i not in seen:
+                    seen.add(i)
+                    todo.extend(neighbor[i])
+            if b not in seen:
+                count += 1
+
+        return count
+
+    def score(self, content_list):
+        """
+        Calculate the xscore terms of one ligand
+        :param content_list: Lines of the ligand in mol2 format
+        :return: List of VDW, HB, HM, HS and RT
+        """
+
+        return self.score_batch([next(Get_info_tools.parse_ligand(content_list), None)])[0]
+
+    def type_ligand(self, record):
+        """
+        Type the atoms of one ligand and keep its heavy atoms
+        :param record: the ligand as given by read_ligand
+        :return: 3D coordinates, radius and whether donor, acceptor and hydrophobic of every heavy atom, and the number
+                 of rotatable bonds
+        """
+        ligand, content_list = record[3], record[4]
+        kind = ligand.get_kind()
+        element = [i.split(".")[0] for i in kind]
+        bond = self.read_bond(content_list, len(ligand))
+        neighbor = [[] for _ in ligand]
+        for a, b, _ in bond:
+            neighbor[a].append(b)
+            neighbor[b].append(a)
+
+        # Type the ligand atoms, without hydrogens in the file the donors follow the atom types
+        heavy = np.array([i not in ("H", "LP", "Du") for i in element], dtype=bool)
+        has_h = [any(element[j] == "H" for j in i) for i in neighbor]
+        if "H" not in element:
+            has_h = [i in ("N.am", "N.pl3", "N.3", "N.4", "O.3") for i in kind]
+        donor = np.array([e in ("N", "O") and h for e, h in zip(element, has_h)], dtype=bool)
+        acceptor = np.array([e == "O" or (k in ("N.1", "N.2", "N.ar") and not h)
+                             for e, k, h in zip(element, kind, has_h)], dtype=bool)
+        hydrophobic = np.array([(e == "C" and all(element[j] not in ("N", "O") for j in n)) or e in ("Cl", "Br", "I")
+                                or (e == "S" and all(element[j] != "O" for j in n))
+                                for e, n in zip(element, neighbor)], dtype=bool)
+        rotor = self.count_rotor(bond, neighbor, heavy)
+        radius = np.array([self.dict_radius.get(i, 1.8) for i in element])
+
+        return ligand.coord[heavy], radius[heavy], donor[heavy], acceptor[heavy], hydrophobic[heavy], rotor
+
+    def score_batch(self, record_list, atom_num=512):
+        """
+        Calculate the xscore terms of some ligands, with the distances of a group of ligands to the protein at once
+        :param record_list: List of ligands as given by read_ligand, None for a ligand that can not be read
+        :param atom_num: Largest number of heavy atoms of a group, a larger ligand is a group of its own
+        :return: A list of records HMscore features in ligand order
+        """
+        xscore = [[0.0, 0.0, 0.0, 0.0, 0.0] for _ in record_list]
+        typed = []
+        for n, record in enumerate(record_list):
+            if record is None or len(record[3]) == 0:
+                continue
+            typed.append((n, self.type_ligand(record)))
+
+            # Without heavy atoms only the rotatable bonds count
+            if len(typed[-1][1][0]) == 0:
+                xscore[n] = self.get_term(0.0, 0.0, 0.0, 0.0, typed.pop()[1][5])
+
+        # Cut the ligands into groups of about atom_num heavy atoms in a row
+        start = 0
+        while start < len(typed):
+            end, size = start + 1, len(typed[start][1][0])
+            while end < len(typed) and size + len(typed[end][1][0]) <= atom_num:
+                size += len(typed[end][1][0])
+                end += 1
+            for n, term in zip([k[0] for k in typed[start:end]], self.score_group([k[1] for k in typed[start:end]])):
+                xscore[n] = term
+            start = end
+
+        return xscore
+
+    def score_group(self, typed_list):
+        """
+        Calculate the xscore terms of a group of ligands, their heavy atoms stacked against the protein atoms near
+        any of them
+        :param typed_list: List of the typed heavy atoms of every ligand from type_ligand
+        :return: List of VDW, HB, HM, HS and RT of every ligand
+        """
+        coord, radius, donor, acceptor, hydrophobic = [np.concatenate([k[i] for k in typed_list]) for i in range(5)]
+        offset = np.cumsum([0] + [len(k[0]) for k in typed_list])
+
+        # Protein heavy atoms around any ligand of the group
+        candidate = np.unique(np.concatenate([self.index.query_box(
+            k[0].min(axis=0) - self.vdw_cutoff, k[0].max(axis=0) + self.vdw_cutoff) for k in typed_list]))
+        candidate = candidate[self.heavy[candidate]]
+        p_coord, p_radius = self.coord[candidate], self.radius[candidate]
+        d = np.sqrt(self.get_distance2(coord, p_coord))
+
+        # The union of the boxes holds many atoms far from any one ligand, so only the pairs within the cutoff are
+        # scored and summed back onto their ligand atom
+        i, j = np.nonzero(d <= self.vdw_cutoff)
+        r, j = d[i, j], candidate[j]
+
+        # VDW: (d0 / d) ^ 8 - 2 (d0 / d) ^ 4 within the cutoff with the repulsion of a pair held at 1, favourable
+        # contacts are counted positive
+        x = ((radius[i] + self.radius[j]) / np.maximum(r, 0.1)) ** 4
+        vdw = np.bincount(i, np.minimum(x * x - 2 * x, 1), len(coord))
+
+        # HB: donor and acceptor pairs, full below 3.1 angstroms and none beyond 3.6 angstroms
+        pair = donor[i] & self.acceptor[j] | acceptor[i] & self.donor[j]
+        hb = np.bincount(i, np.clip((3.6 - r) / 0.5, 0, 1) * pair, len(coord))
+
+        # HM: hydrophobic ligand atoms with more hydrophobic than polar protein atoms nearby
+        near = r <= self.hm_cutoff
+        env = np.bincount(i, near & self.hydrophobic[j], len(coord)) - np.bincount(i, near & self.polar[j], len(coord))
+        hm = hydrophobic & (env > 0)
+
+        # The sums of the atoms of every ligand
+        vdw, hb, hm = [np.add.reduceat(k.astype(float), offset[:-1]) for k in (vdw, hb, hm)]
+        term_list = []
+        for n, k in enumerate(typed_list):
+            term_list.append(self.get_term(-float(vdw[n]), float(hb[n]), float(hm[n]),
+                                           self.get_hs(k[0], k[1], k[4], d[offset[n]:offset[n + 1]], p_coord, p_radius),
+                                           k[5]))
+
+        return term_list
+
+    def get_hs(self, coord, radius, hydrophobic, d, p_coord, p_radius):
+        """
+        Calculate the solvent accessible surface of the hydrophobic atoms of one ligand buried by the protein
+        :param coord: 3D coordinates of the heavy atoms of the ligand
+        :param radius: Radius of the heavy atoms of the ligand
+        :param hydrophobic: Whether every heavy atom of the ligand is hydrophobic
+        :param d: Distances from the heavy atoms of the ligand to the protein atoms
+        :param p_coord: 3D coordinates of the protein atoms
+        :param p_radius: Radius of the protein atoms
+        :return: HS
+        """
+        hs = 0.0
+        for i in np.nonzero(hydrophobic)[0]:
+            point = coord[i] + (radius[i] + self.probe) * self.sphere
+            other = np.arange(len(coord)) != i
+            free = (self.get_distance2(point, coord[other]) > (radius[other] + self.probe) ** 2).all(axis=1)
+            close = d[i] <= radius[i] + p_radius + 2 * self.probe
+            buried = (self.get_distance2(point, p_coord[close]) <= (p_radius[close] + self.probe) ** 2).any(axis=1)
+            hs += 4 * np.pi * (radius[i] + self.probe) ** 2 * float((free & buried).sum()) / len(self.sphere)
+
+        return hs
+
+    @staticmethod
+    def get_distance2(coord1, coord2):
+        """
+        Calculate the squared distances between two sets of points, one axis at a time which is much faster than
+        summing over the last axis of the broadcast difference and gives the same numbers
+        :param coord1: 3D coordinates of the first points
+        :param coord2: 3D coordinates of the second points
+        :return: Matrix of the squared distances, a row for every first point
+        """
+        return ((coord1[:, None, 0] - coord2[None, :, 0]) ** 2 + (coord1[:, None, 1] - coord2[None, :, 1]) ** 2 +
+                (coord1[:, None, 2] - coord2[None, :, 2]) ** 2)
+
+    def get_term(self, vdw, hb, hm, hs, rotor):
+        """
+        Turn the terms into their -log(Kd) contributions as xscore reports them
+        :return: List of VDW, HB, HM, HS and RT
+        """
+        term = zip([vdw, hb, hm, hs, rotor], ["VDW", "HB", "HM", "HS", "RT"])
+
+        return [round(float(v * self.weight[k]), 2) for v, k in term]
+
+
+class Feature_cache(object):
+    """
+    Single-file store of the features of every protein-ligand pair, evicting the least recently used ones
+    """
+
+    def __init__(self, file_name, max_size=1024):
+        """
+        initialization
+        :param file_name: The name of the SQLite file
+        :param max_size: Largest size of the stored features in MB
+        """
+        self.name = file_name
+        self.max_size = int(max_size * 1024 * 1024)
+        self.hit, self.miss, self.evict = 0, 0, 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(file_name, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS feature (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                        "size INTEGER NOT NULL, used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS feature_used ON feature (used)")
+        self.db.commit()
+
+    @staticmethod
+    def get_file_hash(file_name):
+        """
+        Hash the content of a file
+        :param file_name: the name of the file
+        :return: hex digest of the content
+        """
+        digest = hashlib.sha256()
+        with open(f"{file_name}", 'rb') as fi:
+            for block in iter(lambda: fi.read(1 << 20), b""):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_key(protein_hash, num, lines):
+        """
+        Address the features of a ligand by the content they are calculated from
+        :param protein_hash: hash of the protein file
+        :param num: Accuracy of volume calculation, or a text of all the settings of the volume
+        :param lines: lines of the ligand file of the ligand
+        :return: key of the features
+        """
+        if not isinstance(num, str):
+            num = repr(float(num))
+        digest = hashlib.sha256(f"{protein_hash}\0{num}\0".encode())
+        digest.update("".join(lines).encode())
+
+        return digest.hexdigest()
+
+    def get_many(self, key_list):
+        """
+        Look up the features of some ligands
+        :param key_list: list of keys from get_key
+        :return: dictionary from the keys found to their features
+        """
+        found = {}
+        with self.lock:
+            for i in range(0, len(key_list), 500):
+                part = key_list[i:i + 500]
+                rows = self.db.execute(f"SELECT key, value FROM feature WHERE key IN ({','.join('?' * len(part))})",
+                                       part).fetchall()
+                found.update((k, json.loads(v)) for k, v in rows)
+            self.db.executemany("UPDATE feature SET used = ? WHERE key = ?", [(time.time(), k) for k in found])
+            self.db.commit()
+            self.hit += len(found)
+            self.miss += len(set(key_list)) - len(found)
+
+        return found
+
+    def put_many(self, feature_dict):
+        """
+        Store the features of some ligands and evict the least recently used ones beyond the largest size
+        :param feature_dict: dictionary from keys to lists of features
+        """
+        with self.lock:
+            now = time.time()
+            rows = []
+            for k, v in feature_dict.items():
+                value = json.dumps(v)
+                rows.append((k, value, len(k) + len(value), now))
+            self.db.executemany("INSERT OR REPLACE INTO feature (key, value, size, used) VALUES (?, ?, ?, ?)", rows)
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM feature").fetchone()[0]
+            if total > self.max_size:
+                evict = []
+                for k, size in self.db.execute("SELECT key, size FROM feature ORDER BY used"):
+                    if total <= self.max_size:
+                        break
+                    evict.append((k,))
+                    total -= size
+                self.db.executemany("DELETE FROM feature WHERE key = ?", evict)
+                self.evict += len(evict)
+            self.db.commit()
+
+    def get_stats(self):
+        """
+        Count the hits, misses and evictions so far
+        :return: dictionary of the counters
+        """
+        with self.lock:
+            return {"cache_hits": self.hit, "cache_misses": self.miss, "cache_evictions": self.evict}
+
+    def close(self):
+        """
+        Close the SQLite file
+        """
+        with self.lock:
+            self.db.close()
+
+
+class Column_writer(object):
+    """
+    Write the rows of the result file column by column in chunks, as parquet, arrow, npz or a directory of npy files
+    """
+
+    # Suffix of the result file of every format, the npy files go into a directory
+    dict_suffix = {"parquet": ".parquet", "arrow": ".arrow", "npz": ".npz", "npy": ""}
+
+    def __init__(self, file_name, target, file_format, chunk=4096):
+        """
+        initialization
+        :param file_name: the name of the text result file, its suffix is changed to the one of the format
+        :param target: A list of record labels, the first one is the ligand name and the others are numbers
+        :param file_format: parquet, arrow, npz or npy
+        :param chunk: Number of rows written together
+        """
+        self.file_name = os.path.splitext(file_name)[0] + self.dict_suffix[file_format]
+        self.target = list(target)
+        self.file_format = file_format
+        self.chunk = max(1, int(chunk))
+        self.rows = []
+        self.count = 0
+        if file_format in ("parquet", "arrow"):
+            pyarrow = self.get_pyarrow(file_format)
+            self.pa = pyarrow
+            self.schema = pyarrow.schema([(self.target[0], pyarrow.string())] +
+                                         [(i, pyarrow.float64()) for i in self.target[1:]])
+            if file_format == "parquet":
+                self.writer = pyarrow.parquet.ParquetWriter(self.file_name, self.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.file_name, self.schema)
+
+        # The number columns go to raw files as they come, the npy headers are put in front when the length is known
+        else:
+            self.temp_path = tempfile.mkdtemp(prefix="p3score_column_", dir=os.path.dirname(
+                os.path.abspath(self.file_name)))
+            self.raw = [open(os.path.join(self.temp_path, f"{i}.raw"), 'wb') for i in range(len(self.target) - 1)]
+            self.name_list = []
+
+    @staticmethod
+    def get_pyarrow(file_format):
+        """
+        Import pyarrow, which only parquet and arrow need
+        :param file_format: the format asking for it
+        :return: pyarrow module
+        """
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError(f"--format {file_format} needs pyarrow, please install it: pip install pyarrow")
+
+        return pyarrow
+
+    def write(self, row):
+        """
+        Add one row, the rows are written once a chunk of them is complete
+        :param row: A list of record data
+        """
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the waiting rows as one chunk of every column
+        """
+        if self.rows == []:
+            return
+        name = [str(k[0]) for k in self.rows]
+        value = np.array([k[1:] for k in self.rows], dtype=np.float64).reshape(len(self.rows), -1)
+        if self.file_format == "parquet":
+            self.writer.write_table(self.pa.Table.from_arrays(
+                [self.pa.array(name)] + [self.pa.array(value[:, i]) for i in range(value.shape[1])],
+                schema=self.schema))
+        elif self.file_format == "arrow":
+            self.writer.write_batch(self.pa.RecordBatch.from_arrays(
+                [self.pa.array(name)] + [self.pa.array(value[:, i]) for i in range(value.shape[1])],
+                schema=self.schema))
+        else:
+            self.name_list.extend(name)
+            for i, fo in enumerate(self.raw):
+                fo.write(np.ascontiguousarray(value[:, i]).tobytes())
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        """
+        Write the rest of the rows and finish the result file
+        """
+        self.flush()
+        if self.file_format in ("parquet", "arrow"):
+            self.writer.close()
+            return
+
+        # Every column becomes one npy array, in a npz file or in a directory with an index of the column order
+        try:
+            for fo in self.raw:
+                fo.close()
+            array_list = [(self.target[0], np.array(self.name_list, dtype=str))] + \
+                         [(k, os.path.join(self.temp_path, f"{i}.raw")) for i, k in enumerate(self.target[1:])]
+            if self.file_format == "npz":
+                with zipfile.ZipFile(self.file_name, 'w', allowZip64=True) as fz:
+                    for k, v in array_list:
+                        with fz.open(f"{k}.npy", 'w', force_zip64=True) as fo:
+                            self.write_npy(fo, v)
+            else:
+                os.makedirs(self.file_name, exist_ok=True)
+                index = []
+                for i, (k, v) in enumerate(array_list):
+                    index.append([k, f"{i:02d}_{k.replace('/', '_')}.npy"])
+                    with open(os.path.join(self.file_name, index[-1][1]), 'wb') as fo:
+                        self.write_npy(fo, v)
+                with open(os.path.join(self.file_name, "columns.json"), 'w') as fo:
+                    json.dump(index, fo)
+        finally:
+            shutil.rmtree(self.temp_path, True)
+
+    def abort(self):
+        """
+        Stop after a failed or stopped run, closing the open files and removing the raw columns, the rows already
+        written to a parquet or arrow file stay readable
+        """
+        if self.file_format in ("parquet", "arrow"):
+            self.writer.close()
+            return
+        try:
+            for fo in self.raw:
+                fo.close()
+        finally:
+            shutil.rmtree(self.temp_path, True)
+
+    def write_npy(self, fo, array):
+        """
+        Write one column in npy format
+        :param fo: the opened file
+        :param array: array of the ligand names, or the name of the raw file of a number column
+        """
+        if isinstance(array, np.ndarray):
+            np.lib.format.write_array(fo, array, allow_pickle=False)
+            return
+        np.lib.format.write_array_header_1_0(fo, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                                                  "fortran_order": False, "shape": (self.count,)})
+        with open(array, 'rb') as fi:
+            shutil.copyfileobj(fi, fo, 1 << 20)
+
+
+class Profiler(object):
+    """
+    Record the wall time and work counters of every stage, for every ligand where it applies, as JSON Lines
+    """
+
+    def __init__(self, file_name):
+        """
+        initialization, the file is emptied
+        :param file_name: The name of the JSON Lines file
+        """
+        self.file_name = file_name
+        self.start = time.time()
+        self.local = threading.local()
+        self.fd, self.pid = None, None
+        with open(f"{file_name}", 'w'):
+            pass
+
+    def count(self, **kwargs):
+        """
+        Add to the work counters of the stage running in this thread
+        :param kwargs: Names of the counters and the amount to add
+        """
+        counter = self.local.__dict__.setdefault("counter", {})
+        for k, v in kwargs.items():
+            counter[k] = counter.get(k, 0) + v
+
+    def get_row(self, stage, start, ligand=None):
+        """
+        Close a stage of this thread
+        :param stage: name of the stage
+        :param start: time.perf_counter() when the stage started
+        :param ligand: name of the ligand, if the stage belongs to one
+        :return: the record of the stage and the time it ended
+        """
+        now = time.perf_counter()
+        row = {"stage": stage, "ligand": ligand, "seconds": round(now - start, 6)}
+        row.update(self.local.__dict__.pop("counter", {}))
+
+        return row, now
+
+    def add(self, stage, start):
+        """
+        Close a stage of the ligand handled by this thread, its record waits for take
+        :param stage: name of the stage
+        :param start: time.perf_counter() when the stage started
+        :return: time.perf_counter() when the stage ended
+        """
+        row, now = self.get_row(stage, start)
+        self.local.__dict__.setdefault("rows", []).append(row)
+
+        return now
+
+    def take(self):
+        """
+        Take the records waiting in this thread
+        :return: list of records
+        """
+        return self.local.__dict__.pop("rows", [])
+
+    def log(self, stage, start, ligand=None, **kwargs):
+        """
+        Close a stage and write its record at once
+        :param stage: name of the stage
+        :param start: time.perf_counter() when the stage started
+        :param ligand: name of the ligand, if the stage belongs to one
+        :param kwargs: more work counters of the stage
+        :return: time.perf_counter() when the stage ended
+        """
+        self.count(**kwargs)
+        row, now = self.get_row(stage, start, ligand)
+        self.write([row])
+
+        return now
+
+    def write(self, row_list, ligand=None):
+        """
+        Append records to the file, every process of the pool writes whole lines of its own
+        :param row_list: list of records
+        :param ligand: name of the ligand of records without one
+        """
+        if self.pid != os.getpid():
+            self.fd = os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            self.pid = os.getpid()
+        text = ""
+        for row in row_list:
+            if row["ligand"] is None:
+                row["ligand"] = ligand
+            text += json.dumps(row) + "\n"
+        if text != "":
+            os.write(self.fd, text.encode())
+
+    def get_summary(self):
+        """
+        Add up the records of the file by stage
+        :return: Dictionary from every stage to its calls, seconds and counters, in the order the stages appeared
+        """
+        summary = {}
+        with open(f"{self.file_name}", 'r') as fi:
+            for content in fi:
+                row = json.loads(content)
+                stage = summary.setdefault(row.pop("stage"), {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+                row.pop("ligand")
+                seconds = row.pop("seconds")
+                stage["calls"] += 1
+                stage["seconds"] += seconds
+                stage["max_seconds"] = max(stage["max_seconds"], seconds)
+                for k, v in row.items():
+                    stage[k] = stage.get(k, 0) + v
+
+        return summary
+
+    def show_summary(self):
+        """
+        Print the table of the time and work of every stage
+        """
+        summary = self.get_summary()
+        total = sum(v["seconds"] for v in summary.values()) or 1
+        print(f"****************    profile   ****************")
+        print("{:<16}{:<10}{:<12}{:<12}{:<12}{:<8}{}".format("stage", "calls", "total(s)", "mean(ms)", "max(ms)",
+                                                            "share", "counters"))
+        for stage, v in summary.items():
+            counter = ", ".join(f"{k} {v[k]}" for k in v if k not in ("calls", "seconds", "max_seconds"))
+            print("{:<16}{:<10}{:<12}{:<12}{:<12}{:<8}{}".format(
+                stage, v["calls"], round(v["seconds"], 4), round(v["seconds"] / v["calls"] * 1000, 3),
+                round(v["max_seconds"] * 1000, 3), f"{v['seconds'] / total:.1%}", counter))
+        print(f"Wall time {round(time.time() - self.start, 3)} s, the records in the file of '{self.file_name}'")
+        print(f"**********************************************")
+
+
+class Checkpoint(object):
+    """
+    Keep the results of the finished ligands of a run in a JSON Lines file, so that a stopped run can be resumed
+    """
+
+    def __init__(self, file_name, setting, resume=False):
+        """
+        initialization
+        :param file_name: The name of the checkpoint file
+        :param setting: Dictionary of the settings of the run, a run is only resumed with the same ones
+        :param resume: Take the finished ligands from the file, otherwise the file is started again
+        """
+        self.file_name = file_name
+        self.done, end = {}, 0
+        if resume and os.path.exists(file_name):
+            self.done, end = self.read(file_name, setting)
+
+        # A line cut short by the stop is dropped before new lines follow it
+        if end != 0:
+            with open(f"{file_name}", 'r+b') as fo:
+                fo.truncate(end)
+            self.fo = open(f"{file_name}", 'a')
+
+        # A new run, or a file stopped before its setting line was complete, starts with the setting line
+        else:
+            self.fo = open(f"{file_name}", 'w')
+            self.put_line([{"setting": setting}])
+
+    @staticmethod
+    def read(file_name, setting):
+        """
+        Read the finished ligands of a checkpoint file
+        :param file_name: The name of the checkpoint file
+        :param setting: Dictionary of the settings of the run
+        :return: Dictionary from the ligand index to its name and result, and the length of the complete lines
+        """
+        done, end = {}, 0
+        with open(f"{file_name}", 'r') as fi:
+            for content in iter(fi.readline, ""):
+                try:
+                    row = json.loads(content)
+                except ValueError:
+                    break
+                if not content.endswith("\n"):
+                    break
+                if end == 0 and row.get("setting") != setting:
+
+                    # Changed input files make the finished rows stale, so the run starts again
+                    old = dict(row.get("setting") or {}, file_state=setting.get("file_state"))
+                    if old == setting:
+                        print(f"The input files changed since {file_name} was written, starting the run again")
+                        return {}, 0
+                    raise RuntimeError(f"{file_name} was written by a run with other settings, "
+                                       f"remove it or leave out --resume")
+                if end != 0:
+                    done[row["index"]] = (row["name"], row["row"])
+                end = fi.tell()
+
+        return done, end
+
+    def get(self, index, name):
+        """
+        Find the result of a finished ligand
+        :param index: index of the ligand in the ligand file
+        :param name: name of the ligand, which must match the recorded one
+        :return: ligand name, features and predicted binding energy, None when it is not finished
+        """
+        row = self.done.get(index)
+        if row is None or row[0] != name:
+            return None
+
+        return row[1]
+
+    def put_many(self, row_list):
+        """
+        Record finished ligands and make sure they are on the disk
+        :param row_list: List of the index of every ligand and its ligand name, features and predicted binding energy
+        """
+        self.put_line([{"index": i, "name": k[0], "row": k} for i, k in row_list])
+
+    def put_line(self, line_list):
+        """
+        Write lines of the checkpoint file and make sure they are on the disk
+        :param line_list: List of the dictionaries of the lines
+        """
+        if line_list == []:
+            return
+        self.fo.write("".join(json.dumps(k) + "\n" for k in line_list))
+        self.fo.flush()
+        os.fsync(self.fo.fileno())
+
+    @staticmethod
+    def get_state(file_list):
+        """
+        Describe input files by their size and modification time, so that a changed input is not resumed
+        :param file_list: List of file names
+        :return: List of the absolute name, size and modification time in nanoseconds of every file
+        """
+        state_list = []
+        for file_name in file_list:
+            state = os.stat(file_name)
+            state_list.append([os.path.abspath(file_name), state.st_size, state.st_mtime_ns])
+
+        return state_list
+
+    def close(self):
+        """
+        Close the checkpoint file
+        """
+        self.fo.close()
+
+
+class Ligand_index(object):
+    """
+    Byte offset and length of every ligand of a ligand file, kept in a sidecar file next to it so that a worker can
+    seek straight to its own ligands
+    """
+
+    def __init__(self, file_name, build=False):
+        """
+        initialization, the sidecar is mapped, and written first when it is missing or older than the ligand file
+        :param file_name: The name of the ligand file, which must not be compressed
+        :param build: Write the sidecar even when it is up to date
+        """
+        if get_compression(file_name) is not None:
+            raise RuntimeError(f"{file_name} is compressed, the ligand index needs the plain file")
+        self.file_name = file_name
+        self.sidecar = f"{file_name}.p3idx.npy"
+        state = os.stat(file_name)
+
+        # The first row holds the size and modification time of the ligand file the sidecar belongs to
+        self.row = None
+        if not build and os.path.exists(self.sidecar):
+            try:
+                row = np.load(self.sidecar, mmap_mode="r", allow_pickle=False)
+                if row.ndim == 2 and row.shape[0] > 0 and row.shape[1] == 2 and \
+                        int(row[0, 0]) == state.st_size and int(row[0, 1]) == state.st_mtime_ns:
+                    self.row = row
+            except (OSError, ValueError):
+                pass
+        if self.row is None:
+            self.row = self.build(file_name, state)
+            try:
+                self.save()
+            except OSError as error:
+                print(f"The ligand index can not be kept in {self.sidecar}: {error}")
+
+    def __len__(self):
+        return len(self.row) - 1
+
+    @staticmethod
+    def build(file_name, state):
+        """
+        Find the "molecular" label of every ligand of a ligand file
+        :param file_name: The name of the ligand file
+        :param state: os.stat of the ligand file
+        :return: Array of the size and modification time of the file, then of the byte offset and length of every
+                 ligand
+        """
+        offset = []
+        label = b"@<TRIPOS>MOLECULE"
+        if state.st_size > 0:
+            with open(f"{file_name}", 'rb') as fi, mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                i = data.find(label)
+                while i >= 0:
+                    end = i + len(label)
+
+                    # A label is a whole line, as read_ligand takes it
+                    if (i == 0 or data[i - 1] == 10) and (data[end:end + 1] == b"\n" or data[end:end + 2] == b"\r\n"):
+                        offset.append(i)
+                    i = data.find(label, end)
+        offset = np.array(offset + [state.st_size], dtype=np.int64)
+        row = np.zeros((len(offset), 2), dtype=np.int64)
+        row[0] = state.st_size, state.st_mtime_ns
+        row[1:, 0], row[1:, 1] = offset[:-1], np.diff(offset)
+
+        return row
+
+    def save(self):
+        """
+        Write the sidecar file, workers that build it at the same time replace it whole
+        """
+        temp = f"{self.sidecar}.{os.getpid()}.tmp"
+        with open(f"{temp}", 'wb') as fo:
+            np.save(fo, np.asarray(self.row))
+        os.replace(temp, self.sidecar)
+
+    def read_ligand(self, start=0, end=None, chunk=1 << 24):
+        """
+        Read some ligands of the ligand file, seeking straight to the first one
+        :param start: Index of the first ligand
+        :param end: Index after the last ligand, the end of the file by default
+        :param chunk: Number of bytes read at a time, a larger ligand is read whole
+        :return: Generator of the name, number of atoms, number of rings, Ligand_atoms and
+                 lines of the ligand file of every ligand
+        """
+        row = self.row[1:][start:end]
+        with open(f"{self.file_name}", 'rb') as fi:
+            i = 0
+            while i < len(row):
+
+                # Take the whole ligands that start within a chunk
+                first = int(row[i, 0])
+                j = i + max(1, int(np.searchsorted(row[i:i + (1 << 16), 0], first + chunk, side="right")))
+                fi.seek(first)
+                text = fi.read(int(row[j - 1, 0] + row[j - 1, 1]) - first).decode()
+                yield from Get_info_tools.parse_ligand(split_line(text))
+                i = j
+            fi.close()
+
+
+class Pipeline(object):
+    """
+    Run the stages of every batch in threads of their own, each fed by a bounded queue, and give the batches back in
+    order as soon as all their stages are done
+    """
+
+    def __init__(self, stage_list, depth=2):
+        """
+        initialization, a pipeline is run once
+        :param stage_list: List of the functions of the stages, each called with a batch and giving its part of the
+                           result
+        :param depth: Largest number of batches waiting for every stage and read ahead of the one given back
+        """
+        self.stage_list = stage_list
+        self.depth = max(1, int(depth))
+        self.stop = threading.Event()
+
+    def put(self, fifo, item):
+        """
+        Put an item into a bounded queue, unless the run is stopped while waiting for room
+        :param fifo: the queue
+        :param item: the item
+        :return: whether the item is put
+        """
+        while not self.stop.is_set():
+            try:
+                fifo.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def feed(self, batch_list, order, queue_list):
+        """
+        Read the batches and hand every one to each stage with a future of its part of the result
+        :param batch_list: Iterable of the batches
+        :param order: Queue of the batches and their futures in order, an error of the reading ends it
+        :param queue_list: Queue of every stage
+        """
+        try:
+            for batch in batch_list:
+                future_list = [Future() for _ in self.stage_list]
+                if not self.put(order, (batch, future_list)):
+                    return
+                for fifo, future in zip(queue_list, future_list):
+                    if not self.put(fifo, (batch, future)):
+                        return
+        except BaseException as error:
+            self.put(order, error)
+        finally:
+            for fifo in queue_list:
+                self.put(fifo, None)
+            self.put(order, None)
+
+    def work(self, stage, fifo):
+        """
+        Run a stage on the batches of its queue one after another
+        :param stage: function of the stage
+        :param fifo: queue of the stage
+        """
+        while not self.stop.is_set():
+            try:
+                item = fifo.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            batch, future = item
+            try:
+                future.set_result(stage(batch))
+            except BaseException as error:
+                future.set_exception(error)
+
+    def run(self, batch_list):
+        """
+        Run the stages on every batch
+        :param batch_list: Iterable of the batches, read in a thread of its own
+        :return: Generator of every batch and the list of the results of its stages, in order
+        """
+        order = queue.Queue(self.depth)
+        queue_list = [queue.Queue(self.depth) for _ in self.stage_list]
+        thread_list = [threading.Thread(target=self.feed, args=(batch_list, order, queue_list), daemon=True)]
+        thread_list.extend(threading.Thread(target=self.work, args=(stage, fifo), daemon=True)
+                           for stage, fifo in zip(self.stage_list, queue_list))
+        for thread in thread_list:
+            thread.start()
+
+        # The error of a stage comes out with the result of its batch, and stops the threads
+        try:
+            while True:
+                item = order.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                batch, future_list = item
+                yield batch, [k.result() for k in future_list]
+        finally:
+            self.stop.set()
+            for thread in thread_list:
+                thread.join()
+
+
+class Stream_tools(Get_info_tools):
+    """
+    Calculate the characteristic information and binding energy batch by batch while reading the ligand file
+    """
+
+    # Checkpoint that records the finished ligands and gives them back when a run is resumed
+    checkpoint = None
+
+    # Ligand_index of the ligand file and the range of ligands read through it, all of them are read by default
+    ligand_index, ligand_range = None, (0, None)
+
+    def __init__(self, file_name1, file_name2, num, jobs=1, xscore_jobs=0, xscore_timeout=None, batch=64,
+                 cache=None, box=None):
+        """
+        initialization, only the protein is read here
+        :param file_name1: The name of the ligand file
+        :param file_name2: The name of the protein file
+        :param num: Accuracy of volume calculation
+        :param jobs: Number of processes for the ligand features
+        :param xscore_jobs: Number of concurrent xscore shards in every batch
+        :param xscore_timeout: Seconds allowed for every xscore shard
+        :param batch: Number of ligands handled together
+        :param cache: Feature_cache to reuse the features of ligands scored before
+        :param box: lower and upper corner of the box of the protein residues to keep, all by default
+        """
+
+        self.accuracy = float(num)
+        self.pocket_box = box
+        self.jobs = int(jobs)
+        self.xscore_jobs = int(xscore_jobs)
+        self.xscore_timeout = xscore_timeout
+        self.batch = max(1, int(batch))
+        self.cache = cache
+        self.name1 = file_name1
+        self.name2 = file_name2
+        self.get_protein_info()
+        if self.cache is not None:
+            self.protein_hash = self.cache.get_file_hash(self.name2)
+
+    def __getstate__(self):
+        # The cache stays in the main process, workers of the pool only calculate features
+        state = dict(self.__dict__)
+        state["cache"] = None
+        return state
+
+    def read_batch(self):
+        """
+        Read the ligand file a batch of ligands at a time, only the range of ligands through the index when it is set
+        :return: Generator of lists of ligands as given by read_ligand
+        """
+        record_list = []
+        if self.ligand_index is None:
+            ligand_list = self.read_ligand(self.name1)
+        else:
+            ligand_list = self.ligand_index.read_ligand(*self.ligand_range)
+        for record in ligand_list:
+            record_list.append(record)
+            if len(record_list) == self.batch:
+                yield record_list
+                record_list = []
+        if record_list != []:
+            yield record_list
+
+    def get_batch_result(self, record_list, pool=None, start=0):
+        """
+        Calculate the features and binding energy of a batch of ligands
+        :param record_list: List of ligands as given by read_ligand
+        :param pool: Process pool from open_pool to reuse
+        :param start: Number of ligands before this batch in the ligand file
+        :return: List of ligand name, features and predicted binding energy of every ligand
+        """
+        job = self.get_batch_job(record_list, start)
+        feature_list = self.get_job_geometry(job, pool)
+
+        return self.get_job_result(job, self.get_job_xscore(job), feature_list)
+
+    def get_batch_job(self, record_list, start=0):
+        """
+        Find the ligands of a batch that still need their features, the others are taken from the checkpoint and the
+        cache
+        :param record_list: List of ligands as given by read_ligand
+        :param start: Number of ligands before this batch in the ligand file
+        :return: Dictionary of the batch with its finished rows, the features found in the cache, their keys and the
+                 positions of the ligands to calculate
+        """
+        row_list = [None] * len(record_list)
+        if self.checkpoint is not None:
+            row_list = [self.checkpoint.get(start + i, k[0]) for i, k in enumerate(record_list)]
+        todo = [i for i, k in enumerate(row_list) if k is None]
+
+        # Ligands scored before take their features from the cache and skip xscore and the volume grid
+        feature_list, key_dict = [None] * len(record_list), {}
+        if self.cache is not None and todo != []:
+            num = self.accuracy if not self.is_progressive() else \
+                f"{self.accuracy!r}/{self.volume_tolerance!r}/{self.volume_time!r}"
+            if self.xscore_backend == "native":
+                num = f"{num}/native"
+            key_dict = {i: self.cache.get_key(self.protein_hash, num, record_list[i][4]) for i in todo}
+            feature_dict = self.cache.get_many(list(key_dict.values()))
+            for i, k in key_dict.items():
+                feature_list[i] = feature_dict.get(k)
+
+        return {"record": record_list, "start": start, "row": row_list, "feature": feature_list, "key": key_dict,
+                "todo": [i for i in todo if feature_list[i] is None]}
+
+    def get_job_geometry(self, job, pool=None):
+        """
+        Calculate the volume, polarity and amino acid environment of the ligands of a batch still to calculate
+        :param job: Dictionary of the batch from get_batch_job
+        :param pool: Process pool from open_pool to reuse
+        :return: List of the features of every ligand to calculate
+        """
+        record_list = [job["record"][i] for i in job["todo"]]
+        if record_list == []:
+            return []
+
+        return self.map_ligand([i[3] for i in record_list], pool, [i[0] for i in record_list])
+
+    def get_job_xscore(self, job):
+        """
+        Invoke xscore on the ligands of a batch still to calculate
+        :param job: Dictionary of the batch from get_batch_job
+        :return: A list of records HMscore features of every ligand to calculate
+        """
+        record_list = [job["record"][i] for i in job["todo"]]
+        if record_list == []:
+            return []
+
+        return self.score_molecule(os.path.abspath(self.name2), [i[4] for i in record_list],
+                                   max(1, self.xscore_jobs), index_list=[job["start"] + i for i in job["todo"]],
+                                   record_list=record_list)
+
+    def get_job_result(self, job, xscore, feature_list):
+        """
+        Put the features of a batch together, predict the binding energy of the ligands the checkpoint does not have
+        and record them
+        :param job: Dictionary of the batch from get_batch_job
+        :param xscore: A list of records HMscore features from get_job_xscore
+        :param feature_list: List of the features from get_job_geometry
+        :return: List of ligand name, features and predicted binding energy of every ligand
+        """
+        record_list, predict_info = job["record"], list(job["feature"])
+        new_info = self.join_feature([record_list[i] for i in job["todo"]], xscore, feature_list)
+        for i, k in zip(job["todo"], new_info):
+            predict_info[i] = k
+        if self.cache is not None and job["key"] != {}:
+            self.cache.put_many({job["key"][i]: predict_info[i] for i in job["todo"]})
+        index_list = [i for i, k in enumerate(job["row"]) if k is None]
+        if index_list == []:
+            return job["row"]
+
+        # predicted binding energy
+        start = time.perf_counter()
+        predict_info = [predict_info[i] for i in index_list]
+        predict_list = calc.get_predict_batch([k[:14] for k in predict_info]).tolist()
+        if profiler is not None:
+            profiler.log("predict", start, ligands=len(predict_list))
+        name_list = [record_list[i][0] for i in index_list]
+        if self.is_progressive():
+            new_row = integration(name_list, [k[:14] for k in predict_info], predict_list,
+                                  [k[14] for k in predict_info])
+        else:
+            new_row = integration(name_list, predict_info, predict_list)
+        if self.checkpoint is not None:
+            self.checkpoint.put_many([(job["start"] + i, k) for i, k in zip(index_list, new_row)])
+        row_list = list(job["row"])
+        for i, k in zip(index_list, new_row):
+            row_list[i] = k
+
+        return row_list
+
+    def get_batch_feature(self, record_list, pool=None, start=0):
+        """
+        Calculate the features of a batch of ligands
+        :param record_list: List of ligands as given by read_ligand
+        :param pool: Process pool from open_pool to reuse
+        :param start: Number of ligands before this batch in the ligand file
+        :return: List of the features of every ligand
+        """
+        if record_list == []:
+            return []
+        feature_list = self.map_ligand([i[3] for i in record_list], pool, [i[0] for i in record_list])
+        xscore = self.score_molecule(os.path.abspath(self.name2), [i[4] for i in record_list],
+                                     max(1, self.xscore_jobs), start, record_list=record_list)
+
+        return self.join_feature(record_list, xscore, feature_list)
+
+    def join_feature(self, record_list, xscore, feature_list):
+        """
+        Put the xscore terms and the other features of some ligands together
+        :param record_list: List of ligands as given by read_ligand
+        :param xscore: A list of records HMscore features
+        :param feature_list: List of the volume, polarity, amino acid environment and volume error of every ligand
+        :return: List of the features of every ligand
+        """
+
+        # integration features, the error of a progressive volume follows them
+        predict_info = integration(xscore, [i[0] for i in feature_list], [i[2] for i in record_list],
+                                   [i[1] for i in feature_list], [i[2] for i in feature_list])
+        if self.is_progressive():
+            for k, feature in zip(predict_info, feature_list):
+                k.append(feature[3])
+
+        return predict_info
+
+    def read_job(self):
+        """
+        Read the ligand file a batch at a time and find what every batch still needs
+        :return: Generator of dictionaries of the batches from get_batch_job
+        """
+        count = self.ligand_range[0]
+        batch_list = self.read_batch()
+        while True:
+            start = time.perf_counter()
+            record_list = next(batch_list, None)
+            if record_list is None:
+                return
+            if profiler is not None:
+                profiler.log("read_ligand", start, ligands=len(record_list))
+            yield self.get_batch_job(record_list, count)
+            count += len(record_list)
+
+    def get_result(self):
+        """
+        Calculate the result of every ligand while reading the ligand file, xscore runs on some batches while the
+        ligand features of others are calculated
+        :return: Generator of ligand name, features and predicted binding energy in ligand order
+        """
+        pool = self.open_pool() if self.jobs > 1 else None
+        try:
+            stage_list = [lambda job: self.get_job_geometry(job, pool), self.get_job_xscore]
+            if self.pipeline_depth <= 0:
+                result = ((job, [stage(job) for stage in stage_list]) for job in self.read_job())
+            else:
+                result = Pipeline(stage_list, self.pipeline_depth).run(self.read_job())
+
+            # The binding energy of a batch is predicted as soon as both of its halves are ready
+            for job, (feature_list, xscore) in result:
+                yield from self.get_job_result(job, xscore, feature_list)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
+class Screen_tools(Get_info_tools):
+    """
+    Calculate the binding energy of every ligand of some libraries with every protein of some receptors
+    """
+
+    def __init__(self, ligand_files, protein_files, num, jobs=1, xscore_jobs=0, xscore_timeout=None, batch=64):
+        """
+        initialization, every protein is read and indexed once here
+        :param ligand_files: List of names of ligand files or directories of them
+        :param protein_files: List of names of protein files or directories of them
+        :param num: Accuracy of volume calculation
+        :param jobs: Number of processes for the ligand features
+        :param xscore_jobs: Number of concurrent xscore shards for every protein
+        :param xscore_timeout: Seconds allowed for every xscore shard
+        :param batch: Number of ligands handled together
+        """
+        self.accuracy = float(num)
+        self.jobs = int(jobs)
+        self.xscore_jobs = int(xscore_jobs)
+        self.xscore_timeout = xscore_timeout
+        self.batch = max(1, int(batch))
+        self.name1 = self.find_file(ligand_files, ".mol2")
+        self.name2 = self.find_file(protein_files, ".pdb")
+        box = self.get_ligand_box(self.name1, self.pocket_margin) if self.pocket_margin is not None else None
+        self.receptor = [Stream_tools(None, i, num, 1, xscore_jobs, xscore_timeout, box=box) for i in self.name2]
+
+    @staticmethod
+    def find_file(name_list, suffix):
+        """
+        Replace the directories in a list of file names by the files inside them
+        :param name_list: List of names of files or directories
+        :param suffix: Suffix of the files taken from a directory
+        :return: List of file names
+        """
+        file_list = []
+        for name in name_list:
+            if os.path.isdir(name):
+                file_list.extend(os.path.join(name, i) for i in sorted(os.listdir(name))
+                                 if i.endswith((suffix, suffix + ".gz", suffix + ".bz2", suffix + ".xz")))
+            else:
+                file_list.append(name)
+
+        return file_list
+
+    def get_ligand_feature(self, ligand):
+        """
+        Calculate the volume and polarity of one ligand once, and its amino acid environment in every protein
+        :param ligand: List of ligand molecule information
+        :return: volume, list of nitrogen and oxygen numbers, list of amino acid numbers for every protein
+        """
+        if len(ligand) == 0:
+            return 0, [0, 0], [[0, 0, 0, 0, 0] for i in self.receptor]
+        if profiler is None:
+            volume, center, error = self.get_volume_estimate(ligand)
+            return volume, self.get_polar(ligand), [i.get_ami(ligand, center) for i in self.receptor]
+
+        # Time every stage of the ligand for the profile
+        start = time.perf_counter()
+        volume, center, error = self.get_volume_estimate(ligand)
+        start = profiler.add("volume", start)
+        polar = self.get_polar(ligand)
+        start = profiler.add("polar", start)
+        ami = [i.get_ami(ligand, center) for i in self.receptor]
+        profiler.add("ami", start)
+
+        return volume, polar, ami
+
+    def read_batch(self):
+        """
+        Read the ligand files a batch of ligands at a time
+        :return: Generator of lists of ligands as given by read_ligand
+        """
+        for name in self.name1:
+            record_list = []
+            for record in self.read_ligand(name):
+                record_list.append(record)
+                if len(record_list) == self.batch:
+                    yield record_list
+                    record_list = []
+            if record_list != []:
+                yield record_list
+
+    def get_batch_xscore(self, batch):
+        """
+        Invoke xscore on a batch of ligands with every protein
+        :param batch: Number of ligands before the batch and the list of its ligands as given by read_ligand
+        :return: A list of records HMscore features of every protein
+        """
+        count, record_list = batch
+
+        return [receptor.score_molecule(os.path.abspath(receptor.name2), [i[4] for i in record_list],
+                                        max(1, self.xscore_jobs), count, record_list=record_list)
+                for receptor in self.receptor]
+
+    def get_result(self):
+        """
+        Calculate the result of every ligand with every protein while reading the ligand files, xscore runs on some
+        batches while the ligand features of others are calculated
+        :return: Generator of the ligand name and the list of ligand name, features and predicted binding energy
+                 for every protein
+        """
+        pool = self.open_pool() if self.jobs > 1 else None
+        try:
+            stage_list = [lambda batch: self.map_ligand([i[3] for i in batch[1]], pool, [i[0] for i in batch[1]]),
+                          self.get_batch_xscore]
+            batch_list = self.read_count()
+            if self.pipeline_depth <= 0:
+                result = ((batch, [stage(batch) for stage in stage_list]) for batch in batch_list)
+            else:
+                result = Pipeline(stage_list, self.pipeline_depth).run(batch_list)
+            for (count, record_list), (feature_list, xscore_list) in result:
+
+                # The ligand features are shared by every protein, only xscore and the amino acids differ
+                predict_info = []
+                for n, xscore in enumerate(xscore_list):
+                    predict_info.extend(integration(xscore, [i[0] for i in feature_list],
+                                                    [i[2] for i in record_list], [i[1] for i in feature_list],
+                                                    [i[2][n] for i in feature_list]))
+                start = time.perf_counter()
+                predict_list = calc.get_predict_batch(predict_info).tolist()
+                if profiler is not None:
+                    profiler.log("predict", start, ligands=len(predict_list))
+                row_list = integration([i[0] for i in record_list] * len(self.receptor), predict_info, predict_list)
+                for i, record in enumerate(record_list):
+                    yield record[0], row_list[i::len(record_list)]
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def read_count(self):
+        """
+        Read the ligand files a batch of ligands at a time
+        :return: Generator of the number of ligands before every batch and the list of its ligands
+        """
+        count = 0
+        for record_list in self.read_batch():
+            yield count, record_list
+            count += len(record_list)
+
+
+class Trajectory_tools(Get_info_tools):
+    """
+    Calculate the features and binding energy of every frame of a trajectory of one protein-ligand complex, the atoms
+    are named once and only their coordinates are read for every frame
+    """
+
+    def __init__(self, file_name1, file_name2, num, xscore_jobs=0, xscore_timeout=None, batch=64, skin=2.0):
+        """
+        initialization, the first frame is read here
+        :param file_name1: The name of the ligand file with one molecule a frame, or a directory of frame files
+        :param file_name2: The name of the protein file with one model a frame, or a directory of frame files
+        :param num: Accuracy of volume calculation
+        :param xscore_jobs: Number of concurrent xscore runs in every batch
+        :param xscore_timeout: Seconds allowed for every xscore run
+        :param batch: Number of frames handled together
+        :param skin: Distance kept in the neighbor list beyond the contact distance
+        """
+        self.accuracy = float(num)
+        self.xscore_jobs = int(xscore_jobs)
+        self.xscore_timeout = xscore_timeout
+        self.batch = max(1, int(batch))
+        self.name1 = self.find_frame(file_name1, ".mol2")
+        self.name2 = self.find_frame(file_name2, ".pdb")
+        self.frame_list = self.read_frame()
+        protein, block, ligand = next(self.frame_list)
+
+        # The topology of the first frame holds for every frame
+        self.protein_info = protein
+        self.protein_index = Protein_index(protein)
+        self.native = Xscore_native(protein, self.protein_index) if self.xscore_backend == "native" else None
+        self.atom, self.ring = ligand[1], ligand[2]
+        self.atom_polar = self.get_polar(ligand[3])
+        self.cutoff = 2.5 + ligand[3].get_value(self.dict_vdw_r)
+        self.neighbor = Neighbor_list(self.cutoff.max(initial=2.5), skin)
+        self.frame_list = chain([(protein, block, ligand)], self.frame_list)
+
+        # xscore reads a protein that stays the same from its file
+        self.protein_file = os.path.abspath(get_plain_file(self.name2[0])) if not self.protein_many else None
+
+    @staticmethod
+    def find_frame(name, suffix):
+        """
+        List the frame files of a directory in the natural order of their names, or take a single file
+        :param name: The name of a file or of a directory of frame files
+        :param suffix: Suffix of the frame files taken from a directory
+        :return: List of file names
+        """
+        if not os.path.isdir(name):
+            return [name]
+        file_list = [i for i in os.listdir(name)
+                     if i.endswith((suffix, suffix + ".gz", suffix + ".bz2", suffix + ".xz"))]
+
+        # frame_2 comes before frame_10
+        file_list.sort(key=lambda i: [int(k) if k.isdigit() else k for k in re.split(r"(\d+)", i)])
+
+        return [os.path.join(name, i) for i in file_list]
+
+    def read_frame(self):
+        """
+        Read the protein and ligand of every frame, a side with a single frame stays the same for every frame
+        :return: Generator of the Protein_atoms, text of the model and ligand as given by read_ligand of every frame
+        """
+        protein_list = Protein_atoms.read_frames(k for name in self.name2 for k in Protein_atoms.split_model(name))
+        ligand_list = (k for name in self.name1 for k in self.read_ligand(name))
+        protein_list, self.protein_many = self.peek_frame(protein_list, "protein")
+        ligand_list, ligand_many = self.peek_frame(ligand_list, "ligand")
+        if self.protein_many and ligand_many:
+            pair_list = zip_longest(protein_list, ligand_list)
+        else:
+            pair_list = islice(zip(protein_list, ligand_list), None if self.protein_many or ligand_many else 1)
+
+        # Both sides must have as many frames, and the ligand keeps its atoms
+        first = None
+        for n, (protein, ligand) in enumerate(pair_list):
+            if protein is None or ligand is None:
+                raise RuntimeError(f"the {'protein' if protein is None else 'ligand'} has {n} frames and the "
+                                   f"{'ligand' if protein is None else 'protein'} has more")
+            if first is None:
+                first = ligand
+            elif len(ligand[3]) != len(first[3]):
+                raise RuntimeError(f"ligand frame {n + 1} has {len(ligand[3])} atoms, the first frame has "
+                                   f"{len(first[3])}")
+            yield protein[0], protein[1], ligand
+
+    @staticmethod
+    def peek_frame(frame_list, name):
+        """
+        Look at the first two frames of one side of the trajectory
+        :param frame_list: Iterator of the frames
+        :param name: Name of the side for the error message
+        :return: Iterator of the frames, which repeats a single frame without end, and whether there are more frames
+        """
+        head = list(islice(frame_list, 2))
+        if head == []:
+            raise RuntimeError(f"no {name} frame is found")
+        if len(head) == 1:
+            return repeat(head[0]), False
+
+        return chain(head, frame_list), True
+
+    def read_batch(self):
+        """
+        Read the trajectory a batch of frames at a time
+        :return: Generator of lists of the number, Protein_atoms, text of the model and ligand of every frame
+        """
+        batch, start = [], time.perf_counter()
+        for n, (protein, block, ligand) in enumerate(self.frame_list):
+            batch.append((n + 1, protein, block, ligand))
+            if len(batch) == self.batch:
+                if profiler is not None:
+                    profiler.log("read_frame", start, frames=len(batch))
+                yield batch
+                batch, start = [], time.perf_counter()
+        if batch != []:
+            if profiler is not None:
+                profiler.log("read_frame", start, frames=len(batch))
+            yield batch
+
+    def get_batch_geometry(self, batch):
+        """
+        Calculate the volume and amino acid environment of the ligand in every frame of a batch, the neighbor list is
+        carried from frame to frame
+        :param batch: List of frames from read_batch
+        :return: List of the volume, list of amino acid numbers and error of the volume of every frame
+        """
+        feature_list = []
+        for frame, protein, block, ligand in batch:
+            if len(ligand[3]) == 0:
+                feature_list.append([0, [0, 0, 0, 0, 0], None])
+                continue
+            start = time.perf_counter()
+            volume, center, error = self.get_volume_estimate(ligand[3])
+            if profiler is not None:
+                start = profiler.log("volume", start, frame)
+
+            # Only the protein atoms of the neighbor list are looked at
+            coord = ligand[3].coord
+            candidate = self.neighbor.update(protein, coord,
+                                             self.protein_index if protein is self.protein_info else None)
+            ami = self.get_ami_candidate(coord, self.cutoff, center, candidate, protein.coord)
+            if profiler is not None:
+                profiler.log("ami", start, frame, neighbor_atoms=len(candidate))
+            feature_list.append([volume, ami, error])
+
+        return feature_list
+
+    def get_batch_xscore(self, batch):
+        """
+        Invoke xscore on the frames of a batch, on all of them at once when the protein stays the same
+        :param batch: List of frames from read_batch
+        :return: A list of records HMscore features of every frame
+        """
+        molecule_list = [k[3][4] for k in batch]
+        if not self.protein_many:
+            return self.score_molecule(self.protein_file, molecule_list, max(1, self.xscore_jobs), batch[0][0] - 1,
+                                       record_list=[k[3] for k in batch])
+        start = time.perf_counter()
+        if self.xscore_backend == "native":
+            xscore = []
+            for frame, protein, block, ligand in batch:
+                xscore.extend(self.native.move(protein, Protein_index(protein)).score_batch([ligand]))
+            if profiler is not None:
+                profiler.log("xscore", start, ligands=len(batch))
+            return xscore
+
+        # Every frame of a moving protein gets a protein file of its own
+        with tempfile.TemporaryDirectory(prefix="p3score_") as temp_path:
+            for frame, protein, block, ligand in batch:
+                with open(f"{temp_path}/frame_{frame}.pdb", "wb") as fo:
+                    fo.write(block)
+            with ThreadPoolExecutor(max(1, self.xscore_jobs)) as pool:
+                result = list(pool.map(lambda k: self.run_xscore(f"{temp_path}/frame_{k[0]}.pdb", [k[3][4]],
+                                                                 self.xscore_timeout), batch))
+        xscore, error = [], []
+        for k, (temp, message) in zip(batch, result):
+            if message is not None:
+                error.append(f"xscore of frame {k[0]}: {message}")
+            xscore.extend(temp)
+        if error != []:
+            raise RuntimeError("\n".join(error))
+        if profiler is not None:
+            profiler.log("xscore", start, ligands=len(batch), shards=len(batch))
+
+        return xscore
+
+    def get_result(self):
+        """
+        Calculate the features and binding energy of every frame, xscore runs on some batches while the geometry of
+        others is calculated
+        :return: Generator of the frame number, features and predicted binding energy of every frame in order
+        """
+        stage_list = [self.get_batch_geometry, self.get_batch_xscore]
+        if self.pipeline_depth <= 0:
+            result = ((batch, [stage(batch) for stage in stage_list]) for batch in self.read_batch())
+        else:
+            result = Pipeline(stage_list, self.pipeline_depth).run(self.read_batch())
+        for batch, (feature_list, xscore) in result:
+
+            # The number of rings and of nitrogen and oxygen atoms come from the topology
+            predict_info = integration(xscore, [k[0] for k in feature_list], [self.ring] * len(batch),
+                                       [self.atom_polar] * len(batch), [k[1] for k in feature_list])
+            start = time.perf_counter()
+            predict_list = calc.get_predict_batch(predict_info).tolist()
+            if profiler is not None:
+                profiler.log("predict", start, ligands=len(predict_list))
+            row_list = integration([k[0] for k in batch], predict_info, predict_list)
+            if self.is_progressive():
+                row_list = integration(row_list, [k[2] for k in feature_list])
+            yield from row_list
+
+
+class Score_server(object):
+    """
+    Long-running scoring service that keeps the parsed protein in memory
+    """
+
+    def __init__(self, file_name2, num, xscore_jobs=1, xscore_timeout=None, max_jobs=4, cache=None, max_size=64):
+        """
+        initialization
+        :param file_name2: The name of the protein file
+        :param num: Accuracy of volume calculation
+        :param xscore_jobs: Number of concurrent xscore shards in every request
+        :param xscore_timeout: Seconds allowed for every xscore shard
+        :param max_jobs: Number of requests scored at the same time, more are turned away
+        :param cache: Feature_cache to reuse the features of ligands scored before
+        :param max_size: Largest request in MB, larger ones are turned away before they are read
+        """
+        self.tool = Stream_tools(None, file_name2, num, 1, xscore_jobs, xscore_timeout, cache=cache)
+        self.max_size = int(max_size * (1 << 20))
+        self.max_jobs = int(max_jobs)
+        self.limit = threading.BoundedSemaphore(self.max_jobs)
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.metrics = {"requests": 0, "ligands": 0, "errors": 0, "rejected": 0, "active": 0, "score_seconds": 0.0}
+
+    def score(self, text):
+        """
+        Calculate the features and binding energy of the ligands in some text of a ligand file
+        :param text: One or more ligands in mol2 format
+        :return: List of dictionaries from the labels of the result file to the values of every ligand
+        """
+        record_list = list(self.tool.parse_ligand(text.replace("\r\n", "\n").splitlines(True)))
+        if record_list == []:
+            raise ValueError("no @<TRIPOS>MOLECULE found in the request")
+
+        return [dict(zip(self.tool.get_target(), k)) for k in self.tool.get_batch_result(record_list)]
+
+    def count(self, **kwargs):
+        """
+        Add to the counters of the metrics
+        :param kwargs: Names of the counters and the amount to add
+        """
+        with self.lock:
+            for k, v in kwargs.items():
+                self.metrics[k] += v
+
+    def get_health(self):
+        """
+        Describe the state of the service
+        :return: Dictionary of the protein, the limits and the metrics
+        """
+        with self.lock:
+            metrics = dict(self.metrics)
+        if self.tool.cache is not None:
+            metrics.update(self.tool.cache.get_stats())
+
+        return {"status": "ok", "protein_file": self.tool.name2, "protein_atoms": len(self.tool.protein_info),
+                "accuracy": self.tool.accuracy, "max_jobs": self.max_jobs, "max_size": self.max_size,
+                "uptime_seconds": round(time.time() - self.start, 3), "metrics": metrics}
+
+    def serve(self, host="127.0.0.1", port=8765, unix_socket=None):
+        """
+        Answer requests until interrupted
+        :param host: Address to listen on
+        :param port: Port to listen on
+        :param unix_socket: Path of a Unix socket to listen on instead of host and port
+        """
+        if unix_socket is not None:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            server = Unix_http_server(unix_socket, Score_handler)
+            print(f"P3-Score is listening on {unix_socket}")
+        else:
+            server = ThreadingHTTPServer((host, port), Score_handler)
+            print(f"P3-Score is listening on http://{host}:{server.server_address[1]}")
+        server.score_server = self
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if unix_socket is not None and os.path.exists(unix_socket):
+                os.remove(unix_socket)
+
+
+class Unix_http_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server on a Unix socket, one thread per request
+    """
+    daemon_threads = True
+
+
+class Score_handler(BaseHTTPRequestHandler):
+    """
+    Requests of the scoring service:
+    POST /score with one or more ligands in mol2 format returns the features and binding energy as JSON
+    GET /health and GET /metrics return the state of the service
+    """
+
+    def do_GET(self):
+        server = self.server.score_server
+        if self.path == "/health":
+            self.reply(200, server.get_health())
+        elif self.path == "/metrics":
+            self.reply(200, server.get_health()["metrics"])
+        else:
+            self.reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        server = self.server.score_server
+        if self.path != "/score":
+            self.reply(404, {"error": f"unknown path {self.path}"})
+            return
+
+        # The mol2 text is only read as far as a valid Content-Length says, and only up to the largest size
+        server.count(requests=1)
+        length = self.headers.get("Content-Length")
+        if length is None or not length.strip().isdigit():
+            server.count(errors=1)
+            self.reply(400, {"error": f"the request needs the length of the ligands in Content-Length, not {length}"})
+            return
+        if int(length) > server.max_size:
+            server.count(rejected=1)
+            self.reply(413, {"error": f"the request of {int(length)} bytes is larger than {server.max_size} bytes"})
+            return
+        text = self.rfile.read(int(length)).decode(errors="replace")
+
+        # Turn the request away instead of queueing it when all the slots are busy
+        if not server.limit.acquire(blocking=False):
+            server.count(rejected=1)
+            self.reply(503, {"error": f"all {server.max_jobs} scoring slots are busy, please retry"})
+            return
+        server.count(active=1)
+        start = time.time()
+        try:
+            result = server.score(text)
+        except (ValueError, IndexError) as error:
+            server.count(errors=1)
+            self.reply(400, {"error": f"the ligands can not be read: {error}"})
+        except RuntimeError as error:
+            server.count(errors=1)
+            self.reply(500, {"error": str(error)})
+        else:
+            server.count(ligands=len(result))
+            self.reply(200, {"ligands": result})
+        finally:
+            server.count(active=-1, score_seconds=time.time() - start)
+            server.limit.release()
+
+    def reply(self, code, data):
+        """
+        Send a JSON answer
+        :param code: HTTP status code
+        :param data: Data to send
+        """
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+
+# Directory of the trimmed and decompressed protein files of this process, made by get_work_path
+work_path = None
+
+
+def get_work_path():
+    """
+    Give the temporary directory of the protein files made for xscore, removed when the process exits
+    :return: path of the directory
+    """
+    global work_path
+    if work_path is None:
+        work_path = tempfile.mkdtemp(prefix="p3score_work_")
+        atexit.register(shutil.rmtree, work_path, True)
+
+    return work_path
+
+
+def get_compression(file_name):
+    """
+    Recognize a compressed file by its first bytes
+    :param file_name: the name of the file
+    :return: gzip, bz2 or lzma module, None for a plain file
+    """
+    with open(f"{file_name}", 'rb') as fi:
+        head = fi.read(6)
+    if head[:2] == b"\x1f\x8b":
+        return gzip
+    if head[:3] == b"BZh":
+        return bz2
+    if head == b"\xfd7zXZ\x00":
+        return lzma
+
+    return None
+
+
+def open_binary(file_name):
+    """
+    Open a plain, gzip, bz2 or xz file for reading bytes, compressed files are decompressed as they are read
+    :param file_name: the name of the file
+    :return: the opened file
+    """
+    compression = get_compression(file_name)
+    if compression is None:
+        return open(f"{file_name}", 'rb')
+
+    return compression.open(f"{file_name}", 'rb')
+
+
+def open_text(file_name):
+    """
+    Open a plain, gzip, bz2 or xz file for reading text, compressed files are decompressed as they are read
+    :param file_name: the name of the file
+    :return: the opened file
+    """
+    compression = get_compression(file_name)
+    if compression is None:
+        return open(f"{file_name}", 'r')
+
+    return compression.open(f"{file_name}", 'rt')
+
+
+def split_line(text):
+    """
+    Cut text into lines the way a file opened for reading text gives them
+    :param text: text of whole lines
+    :return: list of lines, line endings included as "\n"
+    """
+    line_list = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    last = line_list.pop()
+
+    return [k + "\n" for k in line_list] + ([last] if last != "" else [])
+
+
+def get_plain_file(file_name):
+    """
+    Give a plain file with the content of a file, compressed files are decompressed into the work directory
+    :param file_name: the name of the file
+    :return: the name of the plain file
+    """
+    if get_compression(file_name) is None:
+        return file_name
+    base = os.path.splitext(os.path.basename(file_name))[0]
+    plain_name = os.path.join(get_work_path(), f"{len(os.listdir(get_work_path()))}_{base}")
+    with open_text(file_name) as fi, open(plain_name, 'w') as fo:
+        shutil.copyfileobj(fi, fo, 1 << 20)
+
+    return plain_name
 
-        # Read the features of HMscore
-        else:
-            with open('xscore.log', 'r') as fl:
-                count = 0
-                row = [1, 2, 4, 5, 6]
-                while True:
-                    temp = []
-                    content = fl.readline().strip().split()
-                    if content == []:
-                        count += 1
-                        if count == 10:
-                            break
-                        continue
-                    if content[0] == "Total":
-                        for i in row:
-                            temp.append(float(content[i]))
-                        self.xscore.append(temp)
-                        count = 0
 
-        return self.xscore
+# Profiler of this run, set by start_profile, nothing is timed without it
+profiler = None
 
 
-class calc(object):
+def start_profile(file_name=None):
     """
-    Provides the calculation of the scoring function
+    Record the time and work of every stage from now on, before any process pool is started
+    :param file_name: The name of the JSON Lines file, None stops recording
+    :return: Profiler, or None
     """
-    row = [0, 1, 2, 3, 4, 5, 8, 10, 11, 12, 13, 14, 15, 16, 17, 24, 25, 26, 27, 28, 31, 33, 38, 40, 41, 46, 47, 50,
-           61, 65, 66, 67, 68, 72, 74, 79, 86, 97, 100, 101, 103, 107, 108, 110, 111, 112, 115, 117, 119, 121, 128,
-           132, 136, 142, 143, 146, 148, 155, 170, 171, 172, 177, 182, 187, 192, 193, 199, 204, 205, 213, 216, 217,
-           219, 233, 236, 243, 258, 264, 270, 274, 278, 283, 289, 291, 295, 300, 304, 311, 312, 321, 336, 345, 346,
-           348, 354, 358, 359, 360, 361, 372, 375, 376, 384, 385, 399, 403, 413, 427, 433, 435, 458, 478, 479, 480,
-           481, 482, 485, 489, 492, 497, 506, 512, 521, 524, 537, 541, 542, 550, 554, 557, 563, 566, 570, 572, 573,
-           575, 584, 589, 590, 606, 609, 611, 623, 637, 639, 651, 655, 662, 670, 671, 676]
-    scale0 = [227.55524632769988, 2.973228393473277, 2.0126773360994417, 129.8330860295337, 4.716392837993995,
-              151.50695268073721, 3.9224218409893914, 2.950142076415521, 1.6614690589883119, 1.472453623203242,
-              0.4882252141187505, 296675.8439772615, 2390.585187665551, 1844.5247606647386, 126551.3094327611,
-              2781.9925309489317, 1200.2875208040216, 1236.9258170988335, 234.5213735988161, 34.848395928370635,
-              38.28959896573556, 9.908179313924798, 15.157885561767685, 3.1399184173117693, 13.483313120870669,
-              11.083426240261288, 14.053004473222394, 5.630752038827854, 430.45563705487973, 3080.322669159909,
-              16.758951023934355, 38.24044782306181, 55.55321832654137, 17.540759707131766, 119895.36813987223,
-              1660.872858871134, 17.723170667216927, 1.505586271857734, 34.54530005320871, 19.0859676245226,
-              3.074722028186388, 15.168746823178392, 2.79303047189354, 12.74564108451648, 11.426149161016449,
-              2.673848858265198, 1.8490945014514202, 1.504661188139918, 337087085.34892535, 1898412.207337988,
-              3629291.810627584, 158097.42547301843, 38041.15412350887, 25488.76082780236, 11978.258191779978,
-              12882.741362166946, 27383.387475175983, 4764.707067539868, 3151660.860778027, 16602.493300107413,
-              38029.23300803305, 17682.50323776452, 2088428.413472216, 85752.29091970452, 12689.70548282853,
-              5000.737185630874, 22788.134660142245, 31859.780924320174, 31943.39541565111, 1595.0785494253412,
-              10518.378756567166, 1672.0125274474592, 4195.299746673912, 325.28685635203124, 31.6595226589258,
-              94.13719747034624, 2847.482400295553, 497.79685456422715, 909269.7764155063, 13400.548200964617,
-              960.9263382086389, 92.08209189171593, 173.1215184528277, 81.62428759447226, 290.3434346393887,
-              289.94943860858274, 17.141769579683107, 13.81196428429597, 53.02325948657239, 91.72734933992824,
-              2822.275151812391, 71.50807438854775, 89.02412113751599, 766302.3128652817, 2990.3689415692647,
-              47.57130476186433, 57.51867035356248, 101.74935312625712, 60.848408879205785, 141.8257067690038,
-              41.585121972204846, 47.24760746026051, 42.49196546813215, 49.05464651925387, 762222.4110814757,
-              18963.919804205874, 598.5427333391859, 4392.3774656091455, 8412.96537484996, 2330.592429156345,
-              122.10235672885506, 85.08967381360814, 110.72095304127103, 198.64174073350821, 169.75195524146616,
-              138.6179844046895, 6.8696045599333475, 386.3481025375999, 13.888196762274807, 183.67948603482253,
-              161.8255969694386, 9.653872763918685, 463928.2365132873, 5953.249754497957, 574.95880618938,
-              9526.664892671424, 7463.851039868166, 6342.460412876236, 2376.4686690119074, 408.57357248607127,
-              77.99926364280881, 3.883247248946046, 94.15015204908993, 32.984845447234825, 4.328000320838915,
-              139.54798040763157, 7.587530567862162, 32.115606622121255, 16.78428983496099, 74.80566582195964,
-              203.3576732822364, 93.19774428879137, 1413.5764825137435, 22.40417729428934, 56.737323470894786,
-              109.22148157601208, 10.30571517329792, 23.355889631818858, 31.283356349891193, 9.900689466784234,
-              6.946949396305995]
-    mean0 = [563.3200582100416, 3.9995149163230623, 2.2696361872422983, 171.9067911714767, 5.038927965073976,
-             319.1441314576769, 4.9975745816153285, 5.459131700218288, 2.1765704584040746, 1.851564394858113,
-             0.22580645161290322, 369110.87811302475, 2411.8634804753865, 1538.6111869997574, 114956.53021343648,
-             3323.6922144069854, 1252.3133883094838, 1174.374193548384, 102.45590589376654, 24.836206645646264,
-             25.349248120300807, 9.529105020616063, 10.753965559058953, 1.130244967256852, 9.202118481688144,
-             7.85629396070822, 10.267501819063789, 4.363870967741932, 350.82789231142374, 2140.9271633519297,
-             13.531772980839195, 20.659228716953674, 34.80875576036866, 11.367329614358477, 124807.33335447781,
-             1860.1889219015306, 19.708949793839437, 0.5556633519282076, 29.756973077855932, 13.1040504487024,
-             1.1695367450885277, 13.04487024011642, 1.2131942760126122, 12.067911714770798, 10.692456948823672,
-             1.0904681057482415, 0.7613388309483385, 0.4921173902498181, 273765279.98989236, 1176401.236311038,
-             3020734.1879674965, 55241.341380063146, 18809.429282076133, 16290.902626728137, 6641.46239631336,
-             6923.476831414035, 12157.433113509594, 2985.706025709434, 1675024.4062378625, 10457.76517099199,
-             16271.67815910742, 8788.523878243981, 1334924.306302936, 30371.79026808148, 10215.338782439969,
-             3577.6517099199586, 13551.245282561218, 23116.307324763577, 20076.624011642005, 601.5072277467868,
-             7245.341207858341, 564.4970652437544, 2627.3635217074934, 170.82125151588687, 8.050443851564392,
-             43.59910308028131, 1424.412437545475, 217.8332524860539, 566047.8540014391, 9672.858692117392,
-             313.71858763036664, 61.32794081979135, 100.02420567547902, 37.38120300751886, 172.37863206403065,
-             209.5282803783656, 5.836623817608537, 4.064807179238416, 28.037181663836996, 44.56167278680574,
-             1326.6257674023773, 30.996592287169594, 36.49887460586955, 433833.6814629463, 1798.211552255639,
-             27.508273102110092, 33.66864176570464, 64.66860053359214, 39.60736114479736, 68.63499636187228,
-             21.784292990540788, 22.882325976230923, 24.305212224108622, 25.405748241571608, 422018.00029347645,
-             5271.970004850836, 147.87365995634246, 2990.2519282076178, 4943.090565122483, 1239.1602231384916,
-             34.205748241571676, 51.967620664564635, 58.8254911472229, 97.0158864904196, 109.05760368663594,
-             83.84210526315789, 1.8828522920203734, 144.60938636914867, 3.2667960223138492, 82.8649041959738,
-             73.9140189182634, 2.475624545234053, 285101.19398070674, 4045.67643099685, 172.61789328159094,
-             4914.601451612912, 4165.38503080282, 4292.399211253935, 1460.8416606839692, 128.5282813485326,
-             55.6871210283774, 1.0434149890856173, 60.55687606112054, 20.93233082706767, 1.2318699975745817,
-             99.12563667232598, 2.4319670143099685, 17.641280620907107, 10.533349502789232, 36.676206645646374,
-             137.1290322580645, 51.88552025224351, 453.93524132912927, 6.615086102352656, 26.63667232597623,
-             75.29177783167596, 4.107203492602474, 6.793111811787534, 14.645646373999515, 3.14649527043415,
-             1.7125879214164443]
-    coef = [1.1441663782499432, 0.6362632563970597, 0.33253447912590384, -0.18331956732261662, 0.32611170095566766,
-            0.21370181260429325, -0.22620778244896292, 0.01748181869439621, 0.14748592890410492, 0.013837389850036769,
-            0.2284668633423691, 0.30094884843060427, -0.34522835263792523, 0.19535978463960862, 0.4784858981554066,
-            -0.037227232420745174, -0.1709838878603382, 0.26100767195978863, -0.24471936484221868, -0.0411826799569834,
-            -0.33557623945614046, 0.20556589162253705, -0.2034684186312401, 0.3354167880118972, -0.24637761212732867,
-            0.20894505878650657, 0.5177536306901687, 0.17867247231744113, -0.056550480542314326, -0.34220016044803697,
-            -0.35759795974338227, -0.7561972422887501, -0.03923279437949557, -0.28828176640057557, -0.16810059209701209,
-            -0.2457057081107467, 0.33475447658651525, 0.24020531697399522, 0.05812973242990665, -0.21574986656403236,
-            -0.4444867559025378, 0.1798627080179703, 0.3257855317069273, -0.14224135716212, 0.18236229625179967,
-            0.5488065919350236, 0.15648922285203348, -0.2985823268522644, -0.23209465259466497, -0.23400493641989356,
-            -0.34602532153462967, -0.3024298582344142, 0.08568464720672193, -0.15487644296087474, 0.09245386770235073,
-            -0.3079387382437739, -0.21289176740691554, -0.026202414557244164, -0.18077482380563795, 0.2481902543044735,
-            0.49791030283794085, 0.4733864185797321, -0.1266317220860125, 0.3623946261861203, 0.19299131215823448,
-            0.16273826946940367, -0.1709328305033089, 0.17948218886859266, -0.13909485283748962, -0.3311184518395256,
-            -0.011555420400063817, -0.15552547575805323, -0.21286340241931345, 0.394750693007009, -0.26892137725519444,
-            -0.15568293975676814, -0.20289903577712573, 0.06461356990603107, 0.21267687039845123, 0.17333207362528094,
-            0.23803409599011882, -0.35198261612962684, -0.5099845148381258, 0.2342643844683067, -0.41655426104968374,
-            0.23503975555916493, -0.2963956285579127, 0.16778712576240448, 0.17428585770150512, 0.4005703106463118,
-            -0.3400071763981737, -0.08684607815372794, 0.3330292358292457, 0.017130454666645468, -0.27501765825975344,
-            0.08308075784670002, -0.1902949948715159, -0.2603409229578681, -0.08210247207272314, -0.12134044482440598,
-            -0.17174508179634543, 0.42705354592343203, 0.2585788961713932, -0.1896116240867361, 0.15089675951330955,
-            -0.2684555328237243, 0.15560550133832685, 0.1759904382599455, -0.40913202430899603, -0.1077637481815873,
-            -0.050932256856665706, -0.06946997360000177, 0.2220797691961497, 0.10161301470311854, 0.25288434173999225,
-            -0.14126628663968294, -0.0773046080507367, 0.16343507568291898, -0.23499606284633812, 0.35034408135430906,
-            -0.15392774371317683, 0.1433633023730116, -0.04873045770896722, 0.06960522278792992, 0.10392744519097917,
-            0.63033080636774, -0.35266328578514616, 0.14256599497178377, -0.04056136955217704, 0.1483629938091759,
-            0.07343473843474249, -0.14359719969936524, -0.09667304649129936, -0.09605202635556305, -0.24545620796243228,
-            -0.35702824905195396, 0.4698884097131349, -0.20172520267926403, 0.09474665131798554, -0.04915413846172816,
-            0.5812404219989707, 0.10352389578923392, 0.1762901752874345, 0.21422338283614653, -0.4885168791704469,
-            -0.36325720696925035, 0.2666496877427053, -0.2908737215608939, 0.36613674115710576, -0.25534977122701547,
-            -0.1812676960508424, 6.388217317487271]
+    global profiler
+    profiler = Profiler(file_name) if file_name is not None else None
 
-    def __int__(self):
-        pass
+    return profiler
 
-    @classmethod
-    def get_predict(cls, features):
-        """
-        Predicting binding energy from features
-        :param features: a list of record features
-        :return: predicted binding energy
-        """
 
-        # Extend and trim features
-        num = len(features)
-        expand_features = []
-        expand_features.extend(features[0:4])
+# Feature tool of the current worker process, set once by init_worker
+worker_tool = None
 
-        count = 3
-        for i in range(4, num):
-            count += 1
-            if count in cls.row:
-                expand_features.append(features[i])
-        for i in range(num):
-            for j in range(i, num):
-                count += 1
-                if count in cls.row:
-                    expand_features.append(features[i] * features[j])
-        for i in range(num):
-            for j in range(i, num):
-                for k in range(j, num):
-                    count += 1
-                    if count in cls.row:
-                        expand_features.append(features[i] * features[j] * features[k])
 
-        # Calculate the corresponding data
-        predict = 0
-        for i in range(len(expand_features)):
-            predict += ((expand_features[i] - cls.mean0[i]) / cls.scale0[i]) * float(cls.coef[i])
-        predict += float(cls.coef[-1])
+def init_worker(tool):
+    """
+    Keep the feature tool in a worker process of the pool
+    :param tool: Get_info_tools with the parsed protein
+    """
+    global worker_tool
+    worker_tool = tool
 
-        return round(predict, 4)
+
+def work_ligand(ligand):
+    """
+    Calculate the features of one ligand in a worker process of the pool
+    :param ligand: List of ligand molecule information
+    :return: volume, list of nitrogen and oxygen numbers, list of amino acid numbers, and the profile records when
+             profiling
+    """
+    if profiler is not None:
+        return worker_tool.get_ligand_profile(ligand)
+
+    return worker_tool.get_ligand_feature(ligand)
+
+
+# Labels of the result file
+target = ["ligand_name", "VDW", "HB", "HM", "HS","RT", "volume", "num_ring", "num_N", "num_O", "ami_A1",
+          "ami_B1", "ami_B2", "ami_B3","metal", "predict_PKi/Pkd"]
 
 
 def integration(*args):
@@ -485,21 +3699,188 @@ def integration(*args):
     return integ_list
 
 
-def write_file(file_name, target, pridict_info):
+def write_file(file_name, target, pridict_info, file_format="txt"):
     """
     Provide file write function
     :param file_name: the name of the file
     :param target: A list of record labels
     :param pridict_info: A two-dimensional list of recorded data
+    :param file_format: txt, or a column format of Column_writer
+    """
+    if file_format != "txt":
+        writer = Column_writer(file_name, target, file_format)
+        try:
+            for k in pridict_info:
+                writer.write(k)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return
+    with open(f"{file_name}", "w")as fi:
+        write_row(fi, target)
+        for k in pridict_info:
+            write_row(fi, k)
+        fi.close()
+
+
+def write_row(fi, row):
+    """
+    Write one line of the result file
+    :param fi: the opened file
+    :param row: A list of record data
+    """
+    fi.write(",".join("%s" % i for i in row))
+    fi.write("\n")
+
+
+def write_file_stream(file_name, target, pridict_info, file_format="txt", header=True):
+    """
+    Provide file write function for data that arrives one line at a time
+    :param file_name: the name of the file
+    :param target: A list of record labels
+    :param pridict_info: An iterator of lists of recorded data
+    :param file_format: txt, or a column format of Column_writer
+    :param header: write the line of labels of a txt file
+    :return: Generator of the lists of recorded data once they are written
     """
+    if file_format != "txt":
+        writer = Column_writer(file_name, target, file_format)
+
+        # A failed or stopped run leaves no raw columns or open files behind
+        try:
+            for k in pridict_info:
+                writer.write(k)
+                yield k
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return
     with open(f"{file_name}", "w")as fi:
-        fi.write(",".join("%s" % i for i in target))
-        fi.write("\n")
+        if header:
+            write_row(fi, target)
+        last = time.time()
         for k in pridict_info:
-            fi.write(",".join("%s" % i for i in k))
-            fi.write("\n")
+            write_row(fi, k)
+
+            # Let the finished lines reach the disk about once a second
+            if time.time() - last > 1:
+                fi.flush()
+                last = time.time()
+            yield k
+        fi.close()
+
+
+def write_screen(file_name, info_name, protein_list, screen_info):
+    """
+    Provide file write function of the screening, a matrix of binding energy and the features of every pair
+    :param file_name: the name of the file of the matrix
+    :param info_name: the name of the file of the features
+    :param protein_list: A list of the names of the proteins
+    :param screen_info: An iterator of the ligand name and the recorded data for every protein
+    :return: Number of ligands
+    """
+    count = 0
+    with open(f"{file_name}", "w")as fm, open(f"{info_name}", "w")as fi:
+        write_row(fm, ["ligand_name"] + protein_list)
+        write_row(fi, ["protein_name"] + target)
+        for name, row_list in screen_info:
+            write_row(fm, [name] + [k[-1] for k in row_list])
+            for protein, k in zip(protein_list, row_list):
+                write_row(fi, [protein] + k)
+            count += 1
+        fm.close()
         fi.close()
 
+    return count
+
+
+def check_xscore(protein_file, ligand_file, xscore_timeout=None):
+    """
+    Compare the native xscore terms with the ones of the xscore program on a reference set of ligands
+    :param protein_file: The name of the protein file
+    :param ligand_file: The name of the ligand file of the reference set
+    :param xscore_timeout: Seconds allowed for xscore
+    :return: Dictionary from every term to its correlation, mean absolute difference, slope and intercept of xscore
+             against the native term
+    """
+    protein_info = Protein_atoms.read(protein_file)
+    native = Xscore_native(protein_info, Protein_index(protein_info))
+    molecule_list = Get_info_tools.split_molecule(ligand_file)
+    reference, message = Get_info_tools.run_xscore(os.path.abspath(protein_file), molecule_list, xscore_timeout)
+    if message is not None:
+        raise RuntimeError(f"xscore: {message}")
+    reference = np.array(reference, dtype=float).reshape(-1, 5)
+    record_list = [next(Get_info_tools.parse_ligand(k), None) for k in molecule_list]
+    result = np.array(native.score_batch(record_list), dtype=float).reshape(-1, 5)
+
+    # A term that does not change over the set has no correlation or slope
+    check = {}
+    for i, term in enumerate(["VDW", "HB", "HM", "HS", "RT"]):
+        x, y = result[:, i], reference[:, i]
+        fit = len(x) > 1 and x.std() > 0 and y.std() > 0
+        slope, intercept = np.polyfit(x, y, 1) if fit else (float("nan"), float("nan"))
+        check[term] = {"r": round(float(np.corrcoef(x, y)[0, 1]), 4) if fit else float("nan"),
+                       "mae": round(float(np.abs(x - y).mean()), 4) if len(x) > 0 else float("nan"),
+                       "slope": round(float(slope), 4), "intercept": round(float(intercept), 4)}
+
+    print(f"****************     fix     ****************")
+    print(f"Native xscore terms against xscore on {len(molecule_list)} ligands\n")
+    print("{:<8}{:<12}{:<12}{:<12}{:<12}".format("term", "r", "mae", "slope", "intercept"))
+    for term, v in check.items():
+        print("{:<8}{:<12}{:<12}{:<12}{:<12}".format(term, v["r"], v["mae"], v["slope"], v["intercept"]))
+    print(f"**********************************************")
+
+    return check
+
+
+def select_top(pridict_info, top_k, threshold=None):
+    """
+    Keep the ligands with the highest binding energy in a heap of fixed size while the results arrive
+    :param pridict_info: An iterator of lists of ligand name, features and binding energy
+    :param top_k: Number of ligands kept
+    :param threshold: Lowest binding energy kept, none by default
+    :return: The kept lists from the highest binding energy down, the number of ligands and the number at or above
+             the threshold
+    """
+    heap, count, passed = [], 0, 0
+    for k in pridict_info:
+        count += 1
+        if threshold is not None and k[-1] < threshold:
+            continue
+        passed += 1
+
+        # The earlier ligand stays when two have the same binding energy
+        item = (k[-1], -count, k)
+        if len(heap) < top_k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+
+    return [i[2] for i in sorted(heap, key=lambda i: i[:2], reverse=True)], count, passed
+
+
+def show_top(top_info, count, passed, threshold=None, num=10, file_name="predict_info.txt"):
+    """
+    Print a summary of the ranking instead of every ligand
+    :param top_info: The kept lists of ligand name, features and binding energy from the highest binding energy down
+    :param count: Number of ligands scored
+    :param passed: Number of ligands at or above the threshold
+    :param threshold: Lowest binding energy kept
+    :param num: Number of the best ligands printed
+    :param file_name: the name of the result file
+    """
+    print(f"****************     fix     ****************")
+    print(f"Scored {count} ligands" + (f", {passed} at or above {threshold}" if threshold is not None else "") +
+          f", kept the best {len(top_info)}\n")
+    print(f"id\t\tpredict(Pkd)\tbind_energy")
+    for k in top_info[:num]:
+        print("{:<15}{:<15}{:<8}".format(k[0], k[-1], round(k[-1] * (-1.3634), 4)))
+    if len(top_info) > num:
+        print(f"... {len(top_info) - num} more")
+    show_tail(file_name)
+
 
 def show(ligand_name, predict_list):
     """
@@ -510,52 +3891,399 @@ def show(ligand_name, predict_list):
     """
 
     if len(predict_list) == 1:
-        print(f"****************     fix     ****************")
-        print(f"Predict -log(Kd) = {predict_list[0]}\n")
-        print(f"Predict binding energy = {round(predict_list[0] * (-1.3634), 4)}\n")
-        print(f"The more information in the file of 'predict_info.txt'")
-        print(f"**********************************************")
+        show_one(predict_list[0])
     else:
-        print(f"****************     fix     ****************")
-        print(f"id\t\tpredict(Pkd)\tbind_energy")
+        show_head()
         for i in range(len(predict_list)):
-            print("{:<15}{:<15}{:<8}".format(ligand_name[i], predict_list[i], round(predict_list[i] * (-1.3634), 4)))
-        print(f"The more information in the file of 'predict_info.txt'")
-        print(f"***********************************************")
+            show_row(ligand_name[i], predict_list[i])
+        show_tail()
+
+
+def show_stream(pridict_info, file_name="predict_info.txt"):
+    """
+    Provide printed content for results that arrive one at a time
+    :param pridict_info: An iterator of lists of ligand name, features and binding energy
+    :param file_name: the name of the result file
+    """
+
+    # A single ligand gets its own layout, so the first line waits for the second one
+    first, count = None, 0
+    for k in pridict_info:
+        count += 1
+        if count == 1:
+            first = k
+            continue
+        if count == 2:
+            show_head()
+            show_row(first[0], first[-1])
+        show_row(k[0], k[-1])
+    if count == 1:
+        show_one(first[-1], file_name)
+    else:
+        if count == 0:
+            show_head()
+        show_tail(file_name)
+
+
+def show_trajectory(pridict_info, neighbor):
+    """
+    Provide printed content for the frames of a trajectory, a summary of the binding energy over the frames
+    :param pridict_info: An iterator of lists of frame number, features and binding energy
+    :param neighbor: Neighbor_list of the trajectory
+    """
+    frame_list, predict_list = [], []
+    for k in pridict_info:
+        frame_list.append(k[0])
+        predict_list.append(k[15])
+    print(f"****************     fix     ****************")
+    print(f"Frames: {len(predict_list)}, neighbor list built {neighbor.build} times")
+    if predict_list != []:
+        predict = np.array(predict_list)
+        print("{:<16}{:<16}{:<16}".format("", "frame", "-log(Kd)"))
+        for name, i in [("first", 0), ("min", int(predict.argmin())), ("max", int(predict.argmax())),
+                        ("last", len(predict) - 1)]:
+            print("{:<16}{:<16}{:<16}".format(name, frame_list[i], round(predict_list[i], 4)))
+        print(f"mean {round(float(predict.mean()), 4)}, standard deviation {round(float(predict.std()), 4)}")
+    print(f"The features and -log(Kd) of every frame in the file of 'trajectory_info.txt'")
+    print(f"**********************************************")
+
+
+def show_one(predict, file_name="predict_info.txt"):
+    """
+    Print the binding energy of the only ligand
+    :param predict: binding energy
+    :param file_name: the name of the result file
+    """
+    print(f"****************     fix     ****************")
+    print(f"Predict -log(Kd) = {predict}\n")
+    print(f"Predict binding energy = {round(predict * (-1.3634), 4)}\n")
+    print(f"The more information in the file of '{file_name}'")
+    print(f"**********************************************")
+
+
+def show_head():
+    """
+    Print the head of the table of binding energy
+    """
+    print(f"****************     fix     ****************")
+    print(f"id\t\tpredict(Pkd)\tbind_energy")
+
+
+def show_row(ligand_name, predict):
+    """
+    Print the binding energy of one ligand in the table
+    :param ligand_name: ligand name
+    :param predict: binding energy
+    """
+    print("{:<15}{:<15}{:<8}".format(ligand_name, predict, round(predict * (-1.3634), 4)))
+
+
+def show_tail(file_name="predict_info.txt"):
+    """
+    Print the tail of the table of binding energy
+    :param file_name: the name of the result file
+    """
+    print(f"The more information in the file of '{file_name}'")
+    print(f"***********************************************")
+
+
+def get_ligand_range(count, shard, ligand_range):
+    """
+    Find the ligands of one worker from --shard or --range
+    :param count: number of ligands in the ligand file
+    :param shard: "i/N", the i-th of N nearly equal parts counted from 1, or None
+    :param ligand_range: "start:end", ligand indexes counted from 0 with the end left out, or None
+    :return: index of the first ligand and index after the last ligand
+    """
+    if shard is not None:
+        match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", shard)
+        if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+            raise click.BadParameter(f"{shard} is not i/N with 1 <= i <= N.", param_hint="'--shard'")
+        i, n = int(match.group(1)), int(match.group(2))
+
+        return count * (i - 1) // n, count * i // n
+    match = re.fullmatch(r"\s*(\d*)\s*:\s*(\d*)\s*", ligand_range)
+    if match is None:
+        raise click.BadParameter(f"{ligand_range} is not start:end.", param_hint="'--range'")
+    start = min(int(match.group(1) or 0), count)
+    end = min(int(match.group(2) or count), count)
+    if start > end:
+        raise click.BadParameter(f"{ligand_range} ends before it starts.", param_hint="'--range'")
+
+    return start, end
 
 
 @click.command()
-@click.option("--protein_file", '--p', nargs=1, required=True, help="protein.pdb")
-@click.option("--ligand_file", '--l', nargs=1, required=True, help="ligand.mol2")
+@click.option("--protein_file", '--p', nargs=1, default=None, help="protein.pdb")
+@click.option("--ligand_file", '--l', nargs=1, default=None, help="ligand.mol2")
 @click.option('--ac', nargs=1, default=3, help="float or int")
-def reception_and_display(protein_file, ligand_file, ac):
+@click.option('--jobs', nargs=1, default=1, type=int, help="number of processes for the ligand features")
+@click.option('--xscore_jobs', nargs=1, default=0, type=int,
+              help="number of concurrent xscore shards, each in a temporary directory (0: one xscore here)")
+@click.option('--xscore_timeout', nargs=1, default=None, type=float, help="seconds allowed for every xscore shard")
+@click.option('--stream', is_flag=True, help="read, score and write the ligands batch by batch")
+@click.option('--batch', nargs=1, default=64, type=int, help="number of ligands in a batch of --stream")
+@click.option('--serve', is_flag=True, help="keep the protein in memory and score ligands sent over HTTP")
+@click.option('--host', nargs=1, default="127.0.0.1", help="address of --serve")
+@click.option('--port', nargs=1, default=8765, type=int, help="port of --serve")
+@click.option('--socket', nargs=1, default=None, help="Unix socket of --serve instead of host and port")
+@click.option('--max_jobs', nargs=1, default=4, type=int, help="requests scored at the same time by --serve")
+@click.option('--max_request', nargs=1, default=64, type=float, help="largest request of --serve in MB")
+@click.option('--cache', nargs=1, default=None, help="SQLite file that keeps the features of scored ligands")
+@click.option('--cache_size', nargs=1, default=1024, type=float, help="largest size of --cache in MB")
+@click.option('--receptors', multiple=True, help="protein file or directory of them to screen, can be repeated")
+@click.option('--libraries', multiple=True, help="ligand file or directory of them to screen, can be repeated")
+@click.option('--protein_cache', is_flag=True, help="keep the parsed protein in a binary file next to it for later runs")
+@click.option('--volume_tolerance', nargs=1, default=None, type=float,
+              help="estimate the volume until its 95% confidence half width (angstrom^3) instead of with --ac")
+@click.option('--volume_time', nargs=1, default=None, type=float,
+              help="seconds allowed for the volume of every ligand instead of --ac")
+@click.option('--pocket', nargs=1, default=None, type=float,
+              help="keep only the protein residues within this margin (angstrom) of the ligands, 8 or more keeps "
+                   "the features the same")
+@click.option('--xscore_backend', nargs=1, default="xscore", type=click.Choice(["xscore", "native"]),
+              help="program for the xscore terms, native calculates them in process without xscore")
+@click.option('--xscore_check', is_flag=True,
+              help="compare the native xscore terms with xscore on the ligands of --l and exit")
+@click.option('--profile', nargs=1, default=None,
+              help="JSON Lines file of the time and work of every stage of every ligand, summed up at the end")
+@click.option('--format', 'file_format', nargs=1, default="txt",
+              type=click.Choice(["txt", "parquet", "arrow", "npz", "npy"]),
+              help="format of predict_info, parquet and arrow need pyarrow, npy is a directory of one file a column")
+@click.option('--checkpoint', nargs=1, default=None,
+              help="file that records every finished ligand, which implies --stream")
+@click.option('--resume', is_flag=True, help="skip the ligands already finished in --checkpoint")
+@click.option('--top_k', nargs=1, default=None, type=click.IntRange(min=1),
+              help="keep and write only this number of the best ligands, which implies --stream")
+@click.option('--threshold', nargs=1, default=None, type=float, help="lowest -log(Kd) kept by --top_k")
+@click.option('--trajectory', is_flag=True,
+              help="score every frame of --p and --l, a multi-model pdb, a mol2 of one molecule a frame or "
+                   "directories of frame files")
+@click.option('--skin', nargs=1, default=2.0, type=float,
+              help="distance (angstrom) the neighbor list of --trajectory keeps beyond the contact distance")
+@click.option('--pipeline', nargs=1, default=2, type=click.IntRange(min=0),
+              help="batches read ahead while xscore and the ligand features run at the same time, 0 runs them in turn")
+@click.option('--index', is_flag=True,
+              help="write the byte offset of every ligand of --l next to it for --shard and --range and exit")
+@click.option('--shard', nargs=1, default=None,
+              help="score only the i-th of N equal parts of the ligands of --l, given as i/N, into "
+                   "predict_info.<start>-<end>.txt, which implies --stream")
+@click.option('--range', 'ligand_range', nargs=1, default=None,
+              help="score only the ligands start:end of --l, counted from 0, into predict_info.<start>-<end>.txt, "
+                   "which implies --stream")
+def reception_and_display(protein_file, ligand_file, ac, jobs, xscore_jobs, xscore_timeout, stream, batch, serve,
+                          host, port, socket, max_jobs, max_request, cache, cache_size, receptors, libraries,
+                          protein_cache, volume_tolerance, volume_time, pocket, xscore_backend, xscore_check, profile,
+                          file_format, checkpoint, resume, top_k, threshold, trajectory, skin, pipeline, index,
+                          shard, ligand_range):
     """
     Provide all working procedures, call functions here
     :param protein_file: The name of the ligand file
     :param ligand_file: The name of the protein file
     :param ac: float form 2 to 4
+    :param jobs: number of processes for the ligand features
+    :param xscore_jobs: number of concurrent xscore shards
+    :param xscore_timeout: seconds allowed for every xscore shard
+    :param stream: score the ligands batch by batch with bounded memory
+    :param batch: number of ligands in a batch
+    :param serve: run as a scoring server
+    :param host: address of the server
+    :param port: port of the server
+    :param socket: Unix socket of the server
+    :param max_jobs: requests scored at the same time by the server
+    :param max_request: largest request of the server in MB
+    :param cache: SQLite file of the feature cache, which implies the batch by batch way of stream
+    :param cache_size: largest size of the feature cache in MB
+    :param receptors: protein files or directories to screen
+    :param libraries: ligand files or directories to screen
+    :param protein_cache: keep the parsed protein in a binary sidecar file
+    :param volume_tolerance: half width of the 95% confidence interval of a progressive volume
+    :param volume_time: seconds allowed for a progressive volume
+    :param pocket: margin of the protein residues kept around the ligands
+    :param xscore_backend: program for the xscore terms
+    :param xscore_check: compare the native xscore terms with xscore
+    :param profile: JSON Lines file of the profile
+    :param file_format: format of the result file
+    :param checkpoint: file of the finished ligands, which implies the batch by batch way of stream
+    :param resume: take the finished ligands from the checkpoint
+    :param top_k: number of the best ligands kept, which implies the batch by batch way of stream
+    :param threshold: lowest binding energy kept
+    :param trajectory: score every frame of a trajectory of the protein and the ligand
+    :param skin: distance the neighbor list of the trajectory keeps beyond the contact distance
+    :param pipeline: batches read ahead of the stages running at the same time, 0 runs the stages in turn
+    :param index: write the ligand index of the ligand file
+    :param shard: part of the ligands scored, i/N
+    :param ligand_range: range of the ligands scored, start:end
     """
+    start_profile(profile)
+    if file_format in ("parquet", "arrow"):
+        try:
+            Column_writer.get_pyarrow(file_format)
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+    Get_info_tools.pocket_margin = pocket
+    Get_info_tools.xscore_backend = xscore_backend
+    Get_info_tools.protein_cache = protein_cache
+    Get_info_tools.volume_tolerance, Get_info_tools.volume_time = volume_tolerance, volume_time
+    Get_info_tools.pipeline_depth = pipeline
+
+    # Score every ligand of the libraries with every protein of the receptors
+    if receptors != () or libraries != ():
+        if receptors == () or libraries == ():
+            raise click.UsageError("Screening needs both --receptors and --libraries.")
+
+        # The screening writes its own matrix and features, without the options of a single protein
+        option_list = [("--cache", cache is not None), ("--checkpoint", checkpoint is not None), ("--resume", resume),
+                       ("--top_k", top_k is not None), ("--threshold", threshold is not None),
+                       ("--format", file_format != "txt"), ("--shard", shard is not None),
+                       ("--range", ligand_range is not None), ("--trajectory", trajectory), ("--serve", serve),
+                       ("--xscore_check", xscore_check), ("--index", index)]
+        option_list = [k for k, used in option_list if used]
+        if option_list != []:
+            raise click.UsageError(f"{', '.join(option_list)} can not be used with --receptors and --libraries.")
+        try:
+            tool = Screen_tools(libraries, receptors, ac, jobs, xscore_jobs, xscore_timeout, batch)
+            count = write_screen(f"predict_matrix.txt", f"screen_info.txt", tool.name2, tool.get_result())
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+        print(f"****************     fix     ****************")
+        print(f"Screened {count} ligands with {len(tool.name2)} proteins\n")
+        print(f"The matrix of -log(Kd) in the file of 'predict_matrix.txt'")
+        print(f"The more information in the file of 'screen_info.txt'")
+        print(f"**********************************************")
+        if profiler is not None:
+            profiler.show_summary()
+        return
+
+    # Write the byte offset of every ligand once, so that the workers of the shards start at their own ligands
+    if index:
+        if ligand_file is None:
+            raise click.UsageError("Missing option '--ligand_file' / '--l'.")
+        try:
+            ligand_index = Ligand_index(ligand_file, build=True)
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+        print(f"Indexed {len(ligand_index)} ligands of {ligand_file} in '{ligand_index.sidecar}'")
+        return
+    if protein_file is None:
+        raise click.UsageError("Missing option '--protein_file' / '--p'.")
+
+    # Keep the protein in memory and score the ligands sent to the server
+    feature_cache = Feature_cache(cache, cache_size) if cache is not None else None
+    if serve:
+        Score_server(protein_file, ac, max(1, xscore_jobs), xscore_timeout, max_jobs, feature_cache,
+                     max_request).serve(host, port, socket)
+        return
+    if ligand_file is None:
+        raise click.UsageError("Missing option '--ligand_file' / '--l'.")
+    if xscore_check:
+        try:
+            check_xscore(protein_file, ligand_file, xscore_timeout)
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+        return
+
+    if resume and checkpoint is None:
+        raise click.UsageError("--resume needs --checkpoint.")
+    if threshold is not None and top_k is None:
+        raise click.UsageError("--threshold needs --top_k.")
+    if shard is not None and ligand_range is not None:
+        raise click.UsageError("--shard and --range can not be used together.")
+    if (shard is not None or ligand_range is not None) and trajectory:
+        raise click.UsageError("--shard and --range do not work with --trajectory.")
+
+    # Score every frame of a trajectory and sum up the binding energy over the frames
+    if trajectory:
+        try:
+            tool = Trajectory_tools(ligand_file, protein_file, ac, xscore_jobs, xscore_timeout, batch, skin)
+            show_trajectory(write_file_stream(f"trajectory_info.txt", ["frame"] + tool.get_target()[1:],
+                                              tool.get_result(), file_format), tool.neighbor)
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+        if profiler is not None:
+            profiler.show_summary()
+        return
+
+    # Write and show every ligand as soon as its batch is done
+    sharded = shard is not None or ligand_range is not None
+    if stream or feature_cache is not None or checkpoint is not None or top_k is not None or sharded:
+        run_checkpoint = None
+        result_name = f"predict_info.txt"
+        try:
+            tool = Stream_tools(ligand_file, protein_file, ac, jobs, xscore_jobs, xscore_timeout, batch,
+                                feature_cache)
+
+            # Seek straight to the ligands of this worker and name the result after them, the numbers are padded so
+            # that the results of the shards sort in order and "cat" makes up the whole result
+            if sharded:
+                tool.ligand_index = Ligand_index(ligand_file)
+                count = len(tool.ligand_index)
+                tool.ligand_range = get_ligand_range(count, shard, ligand_range)
+                width = len(str(count))
+                result_name = f"predict_info.{tool.ligand_range[0]:0{width}d}-{tool.ligand_range[1]:0{width}d}.txt"
+                print(f"Scoring the ligands {tool.ligand_range[0]}:{tool.ligand_range[1]} of {count} in "
+                      f"{ligand_file}")
+            if checkpoint is not None:
+                setting = {"ligand_file": os.path.abspath(ligand_file), "protein_file": os.path.abspath(protein_file),
+                           "accuracy": tool.accuracy, "volume": [volume_tolerance, volume_time], "pocket": pocket,
+                           "xscore_backend": xscore_backend, "target": tool.get_target(),
+                           "file_state": Checkpoint.get_state([ligand_file, protein_file])}
+                if sharded:
+                    setting["range"] = list(tool.ligand_range)
+                tool.checkpoint = run_checkpoint = Checkpoint(checkpoint, setting, resume)
+
+            # Only the best ligands are kept in memory, written and summed up
+            if top_k is not None:
+                top_info, count, passed = select_top(tool.get_result(), top_k, threshold)
+                write_file(result_name, tool.get_target(), top_info, file_format)
+                show_top(top_info, count, passed, threshold, file_name=result_name)
+            else:
+                show_stream(write_file_stream(result_name, tool.get_target(), tool.get_result(), file_format,
+                                              header=tool.ligand_range[0] == 0), result_name)
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+        finally:
+            if feature_cache is not None:
+                stats = feature_cache.get_stats()
+                feature_cache.close()
+            if run_checkpoint is not None:
+                run_checkpoint.close()
+        if feature_cache is not None:
+            print(f"Feature cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses, "
+                  f"{stats['cache_evictions']} evictions")
+        if profiler is not None:
+            profiler.show_summary()
+        return
 
     # Extract features
-    tool = Get_info_tools(ligand_file, protein_file, ac)
+    try:
+        tool = Get_info_tools(ligand_file, protein_file, ac, jobs, xscore_jobs, xscore_timeout)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
 
     # integration features
     predict_info = integration(tool.xscore, tool.volume_list, tool.ring, tool.atom_polar,
                                tool.amino_acid)
 
     # predicted binding energy
-    predict_list = []
-    for i in predict_info:
-        predict_list.append(calc.get_predict(i))
+    start = time.perf_counter()
+    predict_list = calc.get_predict_batch(predict_info).tolist()
+    if profiler is not None:
+        profiler.log("predict", start, ligands=len(predict_list))
 
     # write out data
-    target = ["ligand_name", "VDW", "HB", "HM", "HS","RT", "volume", "num_ring", "num_N", "num_O", "ami_A1",
-              "ami_B1", "ami_B2", "ami_B3","metal", "predict_PKi/Pkd"]
     new_predict_info = integration(tool.ligand_name, predict_info, predict_list)
-    write_file(f"predict_info.txt", target, new_predict_info)
+    if tool.is_progressive():
+        new_predict_info = integration(new_predict_info, tool.volume_error)
+    try:
+        write_file(f"predict_info.txt", tool.get_target(), new_predict_info, file_format)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
 
     # show the output
     show(tool.ligand_name, predict_list)
+    if profiler is not None:
+        profiler.show_summary()
 
 
 if __name__ == '__main__':